@@ -0,0 +1,267 @@
+// Browser port of calc_metrics, projection.project and plot_barline_combo,
+// used by the clientside simulation mode. The Python code is the reference
+// implementation; clientside_parity.py checks this file against it.
+(function () {
+    var LAG_DAYS = 10;
+    var BAR_COLOR = '#636efa';
+    var OVER_CAPACITY_COLOR = '#db1313';
+
+    // Python's round() rounds exact halves to even.
+    function pyRound(x) {
+        var r = Math.round(x);
+        if (Math.abs(x % 1) === 0.5) {
+            r = 2 * Math.round(x / 2);
+        }
+        return r;
+    }
+
+    function pyRound2(x) {
+        // toFixed rounds the exact binary value like Python does, except on
+        // exact ties, which only happen for multiples of 1/8.
+        var scaled = x * 100;
+        if (Math.abs(scaled % 1) === 0.5 && scaled / 100 === x) {
+            return pyRound(scaled) / 100;
+        }
+        return Number(x.toFixed(2));
+    }
+
+    // 2**x as the server computes it. Math.pow is often 1 ulp away from the
+    // C library pow that Python uses, which moves rounded counts by one, so
+    // 2**x is evaluated in double-double precision and then rounded once.
+    var LN2_HI = 0.6931471805599453;
+    var LN2_LO = 2.3190468138462996e-17;
+
+    function twoSum(a, b) {
+        var s = a + b;
+        var bb = s - a;
+        return [s, (a - (s - bb)) + (b - bb)];
+    }
+
+    function quickTwoSum(a, b) {
+        var s = a + b;
+        return [s, b - (s - a)];
+    }
+
+    function split(a) {
+        var c = 134217729 * a;
+        var hi = c - (c - a);
+        return [hi, a - hi];
+    }
+
+    function twoProd(a, b) {
+        var p = a * b;
+        var as = split(a);
+        var bs = split(b);
+        return [p, ((as[0] * bs[0] - p) + as[0] * bs[1] + as[1] * bs[0]) + as[1] * bs[1]];
+    }
+
+    function ddAdd(a, b) {
+        var s = twoSum(a[0], b[0]);
+        return quickTwoSum(s[0], s[1] + a[1] + b[1]);
+    }
+
+    function ddMul(a, b) {
+        var p = twoProd(a[0], b[0]);
+        return quickTwoSum(p[0], p[1] + a[0] * b[1] + a[1] * b[0]);
+    }
+
+    function ddDiv(a, d) {
+        var q1 = a[0] / d;
+        var p = twoProd(q1, d);
+        var r = twoSum(a[0], -p[0]);
+        return quickTwoSum(q1, (r[0] + r[1] - p[1] + a[1]) / d);
+    }
+
+    function exp2(x) {
+        var k = Math.round(x);
+        var f = x - k;
+        var t = twoProd(f, LN2_HI);
+        t = quickTwoSum(t[0], t[1] + f * LN2_LO);
+        var sum = [1, 0];
+        var term = [1, 0];
+        for (var n = 1; n < 30 && term[0] !== 0; n++) {
+            term = ddDiv(ddMul(term, t), n);
+            sum = ddAdd(sum, term);
+        }
+        return (sum[0] + sum[1]) * Math.pow(2, k);
+    }
+
+    function calcMetrics(totalDeaths, fatalityRate, daysDeath, doublingTime) {
+        var numberCasesCausingDeath = pyRound(totalDeaths / (fatalityRate / 100));
+        var numberTimesCasesDoubled = pyRound2(daysDeath / doublingTime);
+        var trueCasesToday = pyRound(numberCasesCausingDeath *
+                                     exp2(numberTimesCasesDoubled));
+        return [numberCasesCausingDeath, numberTimesCasesDoubled, trueCasesToday];
+    }
+
+    function trueCasesSeries(trueCasesToday, numberTimesCasesDoubled, simDays) {
+        var series = new Array(simDays + 1);
+        for (var day = 0; day <= simDays; day++) {
+            series[day] = pyRound(trueCasesToday *
+                                  exp2(day / numberTimesCasesDoubled));
+        }
+        return series;
+    }
+
+    // taps are the [day, weight] pairs of a stay kernel (projection.kernel_taps),
+    // null for the 10-day rule. One tap subtracts whole counts; several taps
+    // subtract the rounded weighted sum, in the same order as lag_adjust.
+    function lagAdjustedSeries(caseFactor, trueCases, taps) {
+        var numCases = trueCases.map(function (v) { return pyRound(caseFactor * v); });
+        var adjusted = numCases.slice();
+        taps = taps || [[LAG_DAYS, 1]];
+        if (taps.length === 1) {
+            var lag = taps[0][0];
+            for (var day = lag; day < numCases.length; day++) {
+                adjusted[day] -= numCases[day - lag + 1] - numCases[day - lag];
+            }
+            return adjusted;
+        }
+        for (var d = 0; d < numCases.length; d++) {
+            var removed = 0;
+            taps.forEach(function (tap) {
+                if (d >= tap[0]) {
+                    removed += tap[1] * (numCases[d - tap[0] + 1] - numCases[d - tap[0]]);
+                }
+            });
+            adjusted[d] -= pyRound(removed);
+        }
+        return adjusted;
+    }
+
+    function dateAxis(dateToday, simDays, offset) {
+        var parts = dateToday.split('-').map(Number);
+        var dates = new Array(simDays + 1);
+        for (var day = 0; day <= simDays; day++) {
+            dates[day] = new Date(Date.UTC(parts[0], parts[1] - 1,
+                                           parts[2] + day + offset))
+                .toISOString().slice(0, 10);
+        }
+        return dates;
+    }
+
+    function localDate() {
+        var now = new Date();
+        return new Date(now.getTime() - now.getTimezoneOffset() * 60000)
+            .toISOString().slice(0, 10);
+    }
+
+    function chartLayout(title, yTitle, template) {
+        var layout = {
+            title: {text: '<b>' + title + '</b>', y: 0.9, x: 0.5,
+                    xanchor: 'center', yanchor: 'top', font: {size: 12}},
+            yaxis: {title: {text: yTitle, font: {size: 12}}},
+            transition: {duration: 1000},
+            margin: {l: 50, r: 30, b: 50, t: 90}
+        };
+        if (template) {
+            layout.template = template;
+        }
+        return layout;
+    }
+
+    function totalsFigure(dates, trueCases, template) {
+        return {
+            data: [{type: 'scatter', x: dates, y: trueCases,
+                    line: {width: 2}, mode: 'lines+markers'}],
+            layout: chartLayout('Estimation of true number of cases over time',
+                                'Estimated true number of cases', template)
+        };
+    }
+
+    function barlineFigure(numCases, lagDates, numCapacity, barName, lineName,
+                           chartTitle, template) {
+        var dateCrossed = '-';
+        var colors = new Array(numCases.length);
+        for (var i = 0; i < numCases.length; i++) {
+            colors[i] = numCases[i] > numCapacity ? OVER_CAPACITY_COLOR : BAR_COLOR;
+            if (dateCrossed === '-' && numCases[i] > numCapacity) {
+                dateCrossed = lagDates[i];
+            }
+        }
+        var layout = chartLayout(chartTitle, barName, template);
+        layout.showlegend = false;
+        layout.annotations = [{xref: 'paper', x: 0.65, y: numCapacity,
+                               xanchor: 'right', yanchor: 'bottom',
+                               text: lineName + ' = ' + numCapacity,
+                               font: {family: 'Arial', size: 12},
+                               showarrow: false}];
+        var figure = {
+            data: [
+                {type: 'bar', x: lagDates, y: numCases, name: barName,
+                 marker: {color: colors}},
+                {type: 'scatter', x: lagDates,
+                 y: lagDates.map(function () { return numCapacity; }),
+                 name: lineName}
+            ],
+            layout: layout
+        };
+        return [figure, dateCrossed];
+    }
+
+    function simulate(dateToday, totalDeaths, fatalityRate, daysDeath,
+                      doublingTime, numBeds, numIcus, numVentilators, simDays,
+                      pctHospitalization, pctIcu, pctVentilator, template,
+                      kernels) {
+        // kernels maps series names to stay kernel taps, see lagAdjustedSeries.
+        kernels = kernels || {};
+        var metrics = calcMetrics(totalDeaths, fatalityRate, daysDeath, doublingTime);
+        var trueCases = trueCasesSeries(metrics[2], metrics[1], simDays);
+        var dates = dateAxis(dateToday, simDays, 0);
+        var lagDates = dateAxis(dateToday, simDays, LAG_DAYS);
+        var hospitalizations = barlineFigure(
+            lagAdjustedSeries(pctHospitalization / 100, trueCases,
+                              kernels.hospitalizations), lagDates, numBeds,
+            'Estimated number of hospitalizations needed', 'Hospital beds capacity',
+            'Estimation of number of cases requiring hospitalization<br>(assuming on average ' +
+            pctHospitalization + '% require hospitalization<br>10 days after infection)',
+            template);
+        var icus = barlineFigure(
+            lagAdjustedSeries(pctIcu / 100, trueCases, kernels.icus), lagDates, numIcus,
+            'Estimated number of ICUs needed', 'ICU capacity',
+            'Estimation of number of cases requiring ICUs<br>(assuming on average ' +
+            pctIcu + '% require ICU<br>10 days after infection)',
+            template);
+        var ventilators = barlineFigure(
+            lagAdjustedSeries(pctVentilator / 100, trueCases,
+                              kernels.ventilators), lagDates, numVentilators,
+            'Estimated number of ventilators needed', 'Ventilators capacity',
+            'Estimation of number of cases requiring ventilators<br>(assuming on average ' +
+            pctVentilator + '% require ventilators<br>10 days after infection)',
+            template);
+        return [totalsFigure(dates, trueCases, template),
+                hospitalizations[0], icus[0], ventilators[0],
+                hospitalizations[1], icus[1], ventilators[1]];
+    }
+
+    var simulation = {
+        calcMetrics: calcMetrics,
+        exp2: exp2,
+        simulate: simulate,
+        update_charts: function (nClicks, totalDeaths, fatalityRate, daysDeath,
+                                 doublingTime, numBeds, numIcus, numVentilators,
+                                 simDays, pctHospitalization, pctIcu,
+                                 pctVentilator, template, kernels) {
+            var values = Array.prototype.slice.call(arguments, 1, 12);
+            if (values.some(function (v) { return typeof v !== 'number'; })) {
+                // Input boxes are empty or out of range while being edited.
+                if (window.dash_clientside.no_update !== undefined) {
+                    return Array(7).fill(window.dash_clientside.no_update);
+                }
+                throw new Error('Incomplete simulation inputs');
+            }
+            return simulate(localDate(), totalDeaths, fatalityRate, daysDeath,
+                            doublingTime, numBeds, numIcus, numVentilators,
+                            simDays, pctHospitalization, pctIcu, pctVentilator,
+                            template, kernels);
+        }
+    };
+
+    if (typeof window !== 'undefined') {
+        window.dash_clientside = Object.assign({}, window.dash_clientside,
+                                               {simulation: simulation});
+    }
+    if (typeof module !== 'undefined') {
+        module.exports = simulation;
+    }
+})();
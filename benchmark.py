@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime as dt
+
+import numpy as np
+import plotly
+
+import main
+from projection import date_axes, project, shortage_day, stay_kernel
+from seir import project_seir
+
+
+HORIZONS = (3, 30, 90, 365, 1000)
+
+PARAMETER_SETS = {
+    'default': dict(total_deaths=2, fatality_rate=5, days_death=17.3,
+                    doubling_time=6.18, num_beds=50000, num_icus=10000,
+                    num_ventilators=1000, pct_hospitalization=20, pct_icu=5,
+                    pct_ventilator=1),
+    'slow-growth': dict(total_deaths=500, fatality_rate=1, days_death=20,
+                        doubling_time=12, num_beds=200000, num_icus=20000,
+                        num_ventilators=8000, pct_hospitalization=15,
+                        pct_icu=4, pct_ventilator=2),
+    'fast-growth': dict(total_deaths=50, fatality_rate=2, days_death=14,
+                        doubling_time=3, num_beds=20000, num_icus=2000,
+                        num_ventilators=500, pct_hospitalization=25,
+                        pct_icu=6, pct_ventilator=3),
+}
+
+# A spread of stays for the projection_stay_kernel stage.
+STAY_KERNELS = dict.fromkeys(('hospitalizations', 'icus', 'ventilators'),
+                             stay_kernel('5:1,7:2,10:4,14:2,21:1'))
+
+INPUT_IDS = ('total-deaths', 'fatality-rate', 'days-death', 'doubling-time',
+             'num-beds', 'num-icus', 'num-ventilators', 'sim-days',
+             'pct-hospitalization', 'pct-icu', 'pct-ventilator')
+
+
+def callback_args(params, sim_days):
+    return (params['total_deaths'], params['fatality_rate'],
+            params['days_death'], params['doubling_time'], params['num_beds'],
+            params['num_icus'], params['num_ventilators'], sim_days,
+            params['pct_hospitalization'], params['pct_icu'],
+            params['pct_ventilator'])
+
+
+# Run in a fresh interpreter: time to import main, to serve the page and
+# layout, and to answer the first simulation requests.
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+client = main.server.test_client()
+client.get('/')
+client.get('/_dash-layout')
+page = time.perf_counter()
+for body in json.loads(sys.stdin.read()):
+    client.post('/_dash-update-component', json=body)
+update = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'first_page_s': page - start,
+                  'first_update_s': update - start}))
+'''
+
+
+def measure_startup(runs):
+    bodies = json.dumps(submit_requests(callback_args(PARAMETER_SETS['default'],
+                                                      30)))
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT], input=bodies,
+            capture_output=True, text=True, check=True,
+            # A cold start computes its first update; it must not be served
+            # from results a server on this machine already stored.
+            env=dict(os.environ, SHARED_CACHE='0'),
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {name: statistics.median(s[name] for s in samples)
+            for name in samples[0]} if samples else {}
+
+
+def time_call(fn, repeat, number):
+    per_call = [t / number for t in timeit.repeat(fn, repeat=repeat,
+                                                  number=number)]
+    return {
+        'min_us': min(per_call) * 1e6,
+        'median_us': statistics.median(per_call) * 1e6,
+        'mean_us': statistics.mean(per_call) * 1e6,
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def server_callbacks():
+    # Callbacks the server answers that fire on submit-button. Clientside
+    # callbacks have no Python function and run in the browser, so they are
+    # not measured here.
+    return {output: callback
+            for output, callback in main.app.callback_map.items()
+            if 'callback' in callback and
+            any(i['id'] == 'submit-button' for i in callback['inputs'])}
+
+
+def submit_requests(args, previous=None):
+    # One request body per server callback registered on submit-button,
+    # built from the callback map so it follows the active callback mode:
+    # every input and state of the callback gets its value, as the browser
+    # sends them. previous is the simulation state of the last run in
+    # incremental mode.
+    values = dict(zip(INPUT_IDS, args))
+    values['submit-button'] = 1
+    values['uncertainty-pct'] = 0
+    values['model'] = 'doubling'
+    values['input-spreads'] = ''
+    values['simulation-inputs'] = previous
+    bodies = []
+    for output, callback in server_callbacks().items():
+        outputs = [{'id': o.split('.')[0], 'property': o.split('.')[1]}
+                   for o in output.strip('.').split('...')]
+        bodies.append({
+            'output': output,
+            'outputs': outputs if len(outputs) > 1 else outputs[0],
+            'inputs': [dict(i, value=values[i['id']])
+                       for i in callback['inputs']],
+            'changedPropIds': ['submit-button.n_clicks'],
+            'state': [dict(s, value=values[s['id']])
+                      for s in callback['state']],
+        })
+    return bodies
+
+
+def end_to_end(client, bodies, clear_cache):
+    def run():
+        if clear_cache:
+            main.simulation_cache.clear()
+        for body in bodies:
+            response = client.post('/_dash-update-component', json=body)
+            assert response.status_code == 200, response.status_code
+    return run
+
+
+def response_bytes(client, bodies):
+    return sum(len(client.post('/_dash-update-component', json=body).data)
+               for body in bodies)
+
+
+def own_shared_namespace():
+    # The cold end-to-end stages clear the result cache. With SHARED_CACHE a
+    # server on this machine may use the same file and, for the same code and
+    # settings, the same namespace, so this run's entries get a prefix of
+    # their own and clear() leaves the server's entries alone.
+    shared = getattr(main.simulation_cache, 'shared', None)
+    if shared is not None:
+        shared.namespace = 'benchmark-{}:{}'.format(os.getpid(),
+                                                    shared.namespace)
+
+
+def run_benchmarks(horizons, parameter_sets, repeat, number):
+    own_shared_namespace()
+    try:
+        return timed_runs(horizons, parameter_sets, repeat, number)
+    finally:
+        # Nothing this run stored is of use to anyone else.
+        main.simulation_cache.clear()
+
+
+def timed_runs(horizons, parameter_sets, repeat, number):
+    client = main.server.test_client()
+    date_today = dt.now().date()
+    results = []
+    for name in parameter_sets:
+        params = PARAMETER_SETS[name]
+        metrics_args = (params['total_deaths'], params['fatality_rate'],
+                        params['days_death'], params['doubling_time'])
+        _, number_times_cases_doubled, true_cases_today = \
+            main.calc_metrics(*metrics_args)
+        for sim_days in horizons:
+            args = callback_args(params, sim_days)
+            dates, lag_dates = date_axes(date_today, sim_days)
+            series = project(true_cases_today, number_times_cases_doubled,
+                             sim_days, params['pct_hospitalization'],
+                             params['pct_icu'], params['pct_ventilator'])
+            charts = main.build_bar_charts(date_today, *args)
+            bodies = submit_requests(args)
+            # The same run after only the bed capacity changed.
+            previous = main.simulation_state(date_today, args + (0, 'doubling', ''))
+            previous['num_beds'] += 1
+            capacity_bodies = submit_requests(args, previous)
+            stages = {
+                'calc_metrics': lambda: main.calc_metrics(*metrics_args),
+                'projection': lambda: project(
+                    true_cases_today, number_times_cases_doubled, sim_days,
+                    params['pct_hospitalization'], params['pct_icu'],
+                    params['pct_ventilator']),
+                'projection_stay_kernel': lambda: project(
+                    true_cases_today, number_times_cases_doubled, sim_days,
+                    params['pct_hospitalization'], params['pct_icu'],
+                    params['pct_ventilator'], kernels=STAY_KERNELS),
+                'projection_seir': lambda: project_seir(
+                    true_cases_today, number_times_cases_doubled, sim_days,
+                    params['pct_hospitalization'], params['pct_icu'],
+                    params['pct_ventilator'], **main.SEIR_OPTIONS),
+                'shortage_day': lambda: shortage_day(
+                    true_cases_today, number_times_cases_doubled,
+                    params['pct_hospitalization']/100, params['num_beds'],
+                    sim_days),
+                'plot_totals': lambda: main.plot_totals(dates, series['total']),
+                'plot_barline_combo': lambda: main.plot_barline_combo(
+                    series['hospitalizations'], lag_dates, params['num_beds'],
+                    'Estimated number of hospitalizations needed',
+                    'Hospital beds capacity', 'Benchmark'),
+                'build_bar_charts': lambda: main.build_bar_charts(date_today,
+                                                                  *args),
+                'serialize_bar_charts': lambda: json.dumps(
+                    charts, cls=plotly.utils.PlotlyJSONEncoder),
+                'build_calc_table': lambda: main.build_calc_table(
+                    date_today, *metrics_args),
+                'end_to_end_cold': end_to_end(client, bodies, True),
+                'end_to_end_cached': end_to_end(client, bodies, False),
+                'end_to_end_capacity_change': end_to_end(client,
+                                                         capacity_bodies,
+                                                         False),
+            }
+            for stage, fn in stages.items():
+                result = {'parameter_set': name, 'sim_days': sim_days,
+                          'stage': stage}
+                result.update(time_call(fn, repeat, number))
+                results.append(result)
+            results.append({'parameter_set': name, 'sim_days': sim_days,
+                            'stage': 'response_bytes',
+                            'bytes': response_bytes(client, bodies),
+                            'capacity_change_bytes': response_bytes(
+                                client, capacity_bodies),
+                            'requests': len(bodies)})
+    return results
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Time the simulation and rendering stages in isolation '
+                    'and end-to-end through the Flask test client.')
+    parser.add_argument('--horizons', type=int, nargs='+', default=HORIZONS)
+    parser.add_argument('--parameter-sets', nargs='+',
+                        choices=sorted(PARAMETER_SETS),
+                        default=list(PARAMETER_SETS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=20)
+    parser.add_argument('--startup-runs', type=int, default=3,
+                        help='fresh interpreters started to time cold start')
+    parser.add_argument('--out', default='-',
+                        help='output JSON path, - for stdout')
+    args = parser.parse_args()
+
+    report = {
+        'created': dt.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'plotly': plotly.__version__,
+            'combined_callback': main.settings.COMBINED_CALLBACK,
+            'incremental_updates': main.settings.INCREMENTAL_UPDATES,
+            'clientside_simulation': main.settings.CLIENTSIDE_SIMULATION,
+            'live_updates': main.settings.LIVE_UPDATES,
+            # The end-to-end stages time these outputs; with the clientside
+            # simulation the charts are computed in the browser instead.
+            'server_outputs': list(server_callbacks()),
+        },
+        'startup': measure_startup(args.startup_runs),
+        'results': run_benchmarks(args.horizons, args.parameter_sets,
+                                  args.repeat, args.number),
+    }
+    if args.out == '-':
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,404 @@
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from paths import check_private
+
+
+def value_size(value):
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_size(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(value_size(i) for i in value)
+    return sys.getsizeof(value)
+
+
+def freeze(value):
+    # Marks the arrays in a cached value read-only, so a callback that tried
+    # to modify a result shared with concurrent requests would raise instead.
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, dict):
+        for v in value.values():
+            freeze(v)
+    elif isinstance(value, (tuple, list)):
+        for i in value:
+            freeze(i)
+    return value
+
+
+class SimulationCache:
+    # LRU cache with per-entry expiry and a cap on the summed value sizes.
+    # Safe to share between the threads (or greenlets) of one worker process;
+    # cached arrays are frozen, see freeze().
+
+    def __init__(self, max_entries=1024, ttl=3600, max_bytes=32*1024*1024,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        freeze(value)
+        size = value_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, size, value)
+            self._bytes += size
+            self._evict()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        # Expired entries are dropped lazily by get(); they are also the
+        # least recently used ones, so they go first when over a limit.
+        while (len(self._entries) > self.max_entries or
+               self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+
+def normalize_inputs(values):
+    # The browser sends 20 and 20.0 identically, so integral floats are
+    # folded into ints to give both the same key.
+    normalized = []
+    for value in values:
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        normalized.append(value)
+    return tuple(normalized)
+
+
+def encode_value(value, arrays):
+    # JSON-ready form of a cached value; arrays and numpy scalars are appended
+    # to arrays and stand in by position. Every JSON object is a tagged
+    # wrapper, so plain lists and strings need no escaping.
+    if isinstance(value, np.ndarray):
+        arrays.append(value)
+        return {'array': len(arrays)-1}
+    if isinstance(value, np.generic):
+        arrays.append(np.asarray(value))
+        return {'scalar': len(arrays)-1}
+    if isinstance(value, dict):
+        return {'dict': [[encode_value(k, arrays), encode_value(v, arrays)]
+                         for k, v in value.items()]}
+    if isinstance(value, tuple):
+        return {'tuple': [encode_value(i, arrays) for i in value]}
+    if isinstance(value, list):
+        return [encode_value(i, arrays) for i in value]
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise TypeError('Cannot store {} values'.format(type(value).__name__))
+
+
+def decode_value(value, arrays):
+    if isinstance(value, list):
+        return [decode_value(i, arrays) for i in value]
+    if not isinstance(value, dict):
+        return value
+    if 'array' in value:
+        return arrays[value['array']]
+    if 'scalar' in value:
+        return arrays[value['scalar']][()]
+    if 'tuple' in value:
+        return tuple(decode_value(i, arrays) for i in value['tuple'])
+    return {decode_value(k, arrays): decode_value(v, arrays)
+            for k, v in value['dict']}
+
+
+def dump_value(value):
+    # A JSON header followed by the arrays in .npy format. Unlike a pickle,
+    # loading it can only ever produce data, never run code.
+    arrays = []
+    header = encode_value(value, arrays)
+    chunks = []
+    for array in arrays:
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        chunks.append(buffer.getvalue())
+    header = json.dumps({'value': header,
+                         'sizes': [len(c) for c in chunks]}).encode()
+    return b''.join([len(header).to_bytes(4, 'little'), header] + chunks)
+
+
+def load_value(blob):
+    size = int.from_bytes(blob[:4], 'little')
+    header = json.loads(blob[4:4+size])
+    arrays = []
+    offset = 4 + size
+    for length in header['sizes']:
+        arrays.append(np.load(io.BytesIO(blob[offset:offset+length]),
+                              allow_pickle=False))
+        offset += length
+    return decode_value(header['value'], arrays)
+
+
+class SharedResultStore:
+    # Results shared by every worker process on the machine and kept across
+    # restarts, in one SQLite file. Keys are namespaced, so workers running
+    # different code or settings never read each other's results. The summed
+    # value sizes are capped: expired entries go first, then the least
+    # recently used. Values are stored as JSON and .npy data (see
+    # dump_value), and the file is refused unless it belongs to this user
+    # and no one else can write to it.
+
+    # Seconds between last-use updates of an entry, so that hits are not
+    # each a write.
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path, namespace='', ttl=3600, max_bytes=256*1024*1024,
+                 clock=time.time):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._check_files()
+
+    def _check_files(self):
+        # Creates the file private to this user if it is missing, then
+        # refuses it, or the SQLite journal next to it, if another user could
+        # have written to them.
+        try:
+            os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY |
+                             getattr(os, 'O_NOFOLLOW', 0), 0o600))
+        except FileExistsError:
+            pass
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            check_private(path)
+
+    def _db(self):
+        # One connection per process; a forked child opens its own.
+        if self._pid != os.getpid():
+            self._check_files()
+            connection = sqlite3.connect(self.path, timeout=30,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, value BLOB, size INTEGER,
+                    expires_at REAL, used_at REAL);
+                CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at);
+                CREATE TABLE IF NOT EXISTS totals (bytes INTEGER);
+                INSERT INTO totals SELECT 0 WHERE NOT EXISTS
+                    (SELECT 1 FROM totals);
+            ''')
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _key(self, key):
+        return self.namespace + repr(key)
+
+    def get(self, key):
+        key = self._key(key)
+        now = self._clock()
+        with self._lock:
+            db = self._db()
+            row = db.execute('SELECT value, expires_at, used_at FROM entries '
+                             'WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                return None
+            try:
+                value = load_value(row[0])
+            except (ValueError, KeyError, TypeError):
+                self.misses += 1
+                return None
+            if row[2] < now - self.TOUCH_INTERVAL:
+                db.execute('UPDATE entries SET used_at = ? WHERE key = ?',
+                           (now, key))
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        # Values that cannot be stored stay in the worker's own cache only.
+        try:
+            blob = dump_value(value)
+        except (TypeError, ValueError):
+            return
+        if len(blob) > self.max_bytes:
+            return
+        key = self._key(key)
+        now = self._clock()
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT size FROM entries WHERE key = ?',
+                                 (key,)).fetchone()
+                db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                           (key, blob, len(blob), now + self.ttl, now))
+                db.execute('UPDATE totals SET bytes = bytes + ?',
+                           (len(blob) - (row[0] if row else 0),))
+                self._evict(db, now)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        # Only this namespace: other versions of the app may share the file.
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('DELETE FROM entries WHERE substr(key, 1, ?) = ?',
+                       (len(self.namespace), self.namespace))
+            db.execute('UPDATE totals SET bytes = '
+                       '(SELECT COALESCE(SUM(size), 0) FROM entries)')
+            db.execute('COMMIT')
+
+    def stats(self):
+        with self._lock:
+            entries, = self._db().execute('SELECT COUNT(*) FROM entries').fetchone()
+            total, = self._db().execute('SELECT bytes FROM totals').fetchone()
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'bytes': total,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _evict(self, db, now):
+        total, = db.execute('SELECT bytes FROM totals').fetchone()
+        if total <= self.max_bytes:
+            return
+        freed, count = db.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) '
+                                  'FROM entries WHERE expires_at <= ?',
+                                  (now,)).fetchone()
+        db.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+        total -= freed
+        self.evictions += count
+        while total > self.max_bytes:
+            rows = db.execute('SELECT key, size FROM entries ORDER BY used_at '
+                              'LIMIT 64').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= size
+                self.evictions += 1
+        db.execute('UPDATE totals SET bytes = ?', (total,))
+
+
+class TieredCache:
+    # A worker's own SimulationCache in front of a store shared with the
+    # other workers, such as SharedResultStore or, as a local stand-in,
+    # another SimulationCache. Shared hits are copied into the worker's
+    # cache; new results go to both.
+
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        self.shared.set(key, value)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def stats(self):
+        return dict(self.local.stats(), shared=self.shared.stats())
@@ -0,0 +1,119 @@
+import argparse
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime as dt
+
+import numpy as np
+
+import main
+from engine_parity import random_inputs
+
+
+SIMULATION_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'assets', 'simulation.js')
+
+NODE_RUNNER = '''
+const simulation = require(process.argv[1]);
+const scenarios = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+const results = scenarios.map(function (s) {
+    return simulation.simulate.apply(null, s);
+});
+process.stdout.write(JSON.stringify(results));
+'''
+
+FIGURE_IDS = ('totals-estimate', 'hospitalizations-estimate', 'icus-estimate',
+              'ventilators-estimate')
+DATE_IDS = ('bed-shortage-date', 'icu-shortage-date', 'ventilator-shortage-date')
+
+
+def python_result(date_today, scenario):
+    children = json.loads(json.dumps(
+        main.build_bar_charts(date_today, *scenario),
+        cls=main.plotly.utils.PlotlyJSONEncoder))
+    found = {}
+
+    def walk(component):
+        if isinstance(component, list):
+            for child in component:
+                walk(child)
+        elif isinstance(component, dict):
+            props = component.get('props', {})
+            if props.get('id') in FIGURE_IDS:
+                found[props['id']] = props['figure']
+            elif props.get('id') in DATE_IDS:
+                found[props['id']] = props['children']
+            else:
+                walk(props.get('children'))
+
+    walk(children)
+    return [found[i] for i in FIGURE_IDS + DATE_IDS]
+
+
+def plain(values):
+    # Plotly may serialize arrays as base64 typed arrays.
+    if isinstance(values, dict) and 'bdata' in values:
+        return np.frombuffer(base64.b64decode(values['bdata']),
+                             dtype=values['dtype']).tolist()
+    return list(values)
+
+
+def compare_figures(expected, actual):
+    problems = []
+    for trace_idx, (e, a) in enumerate(zip(expected['data'], actual['data'])):
+        if [str(x)[:10] for x in plain(e['x'])] != plain(a['x']):
+            problems.append('trace {} x'.format(trace_idx))
+        if [float(y) for y in plain(e['y'])] != [float(y) for y in plain(a['y'])]:
+            problems.append('trace {} y'.format(trace_idx))
+        if 'marker' in e and plain(e['marker']['color']) != a['marker']['color']:
+            problems.append('trace {} colors'.format(trace_idx))
+    if expected['layout']['title']['text'] != actual['layout']['title']['text']:
+        problems.append('title')
+    return problems
+
+
+def mismatches(date_today, scenarios):
+    # Runs the scenarios through assets/simulation.js in node and the Python
+    # engine; returns (scenario, problems) for every one that differs. Both
+    # sides use the stay kernels configured in the environment.
+    node_input = json.dumps([[date_today.isoformat()] + s +
+                             [None, main.STAY_KERNEL_TAPS] for s in scenarios])
+    completed = subprocess.run(['node', '-e', NODE_RUNNER, SIMULATION_JS],
+                               input=node_input, capture_output=True,
+                               text=True, check=True)
+    js_results = json.loads(completed.stdout)
+
+    found = []
+    for scenario, js_result in zip(scenarios, js_results):
+        expected = python_result(date_today, scenario)
+        problems = []
+        for name, e, a in zip(FIGURE_IDS, expected[:4], js_result[:4]):
+            problems += ['{} {}'.format(name, p) for p in compare_figures(e, a)]
+        for name, e, a in zip(DATE_IDS, expected[4:], js_result[4:]):
+            if e != a:
+                problems.append('{} {} != {}'.format(name, e, a))
+        if problems:
+            found.append((scenario, problems))
+    return found
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Check assets/simulation.js against the Python engine.')
+    parser.add_argument('-n', '--scenarios', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    scenarios = [random_inputs(rng) for _ in range(args.scenarios)]
+    found = mismatches(dt.now().date(), scenarios)
+    for scenario, problems in found:
+        print('MISMATCH {}: {}'.format(scenario, '; '.join(problems)))
+    print('{} scenarios, {} mismatches'.format(len(scenarios), len(found)))
+    return 1 if found else 0
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,52 @@
+import threading
+
+
+class RequestCoalescer:
+    # Keeps the newest request per key (a browser session in live mode).
+    # begin() hands out a ticket; a request that waits in settle() and sees a
+    # newer ticket for its key gives up, so a burst of edits runs once.
+
+    def __init__(self, delay=0.15):
+        self.delay = delay
+        self._latest = {}
+        self._next_ticket = 0
+        self._condition = threading.Condition()
+        self.started = 0
+        self.superseded = 0
+
+    def begin(self, key):
+        with self._condition:
+            # Tickets are unique across keys, so one is never handed out
+            # again after finish() drops its key.
+            self._next_ticket += 1
+            ticket = self._next_ticket
+            self._latest[key] = ticket
+            self.started += 1
+            self._condition.notify_all()
+            return ticket
+
+    def is_current(self, key, ticket):
+        with self._condition:
+            current = self._latest.get(key) == ticket
+            if not current:
+                self.superseded += 1
+            return current
+
+    def settle(self, key, ticket):
+        # Waits out the debounce delay; returns early, and False, as soon as
+        # a newer request for the same key arrives.
+        with self._condition:
+            self._condition.wait_for(lambda: self._latest.get(key) != ticket,
+                                     timeout=self.delay)
+        return self.is_current(key, ticket)
+
+    def finish(self, key, ticket):
+        # Forget the key once its newest request is done.
+        with self._condition:
+            if self._latest.get(key) == ticket:
+                del self._latest[key]
+
+    def stats(self):
+        with self._condition:
+            return {'sessions': len(self._latest), 'started': self.started,
+                    'superseded': self.superseded}
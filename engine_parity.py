@@ -0,0 +1,180 @@
+import argparse
+import math
+import random
+import sys
+
+import numpy as np
+
+from projection import (as_counts, calc_metrics_batch, first_crossing,
+                        lag_adjust, lagged_counts, project, resource_series,
+                        shortage_day, stay_kernel, true_cases_series)
+
+
+SERIES = ('hospitalizations', 'icus', 'ventilators')
+
+# The default 10-day rule, written as a kernel, plus single-day and spread
+# kernels that take the other paths of lag_adjust and shortage_day.
+KERNEL_SPECS = ('10', '7', '1', '3', '7:1,10:2,14:1', '2:1,30:1')
+
+
+def baseline_metrics(total_deaths, fatality_rate, days_death, doubling_time):
+    # main.calc_metrics before the engine was vectorized.
+    number_cases_causing_death = round(total_deaths / (fatality_rate/100))
+    number_times_cases_doubled = round(days_death / doubling_time, 2)
+    true_cases_today = round(number_cases_causing_death * 2**number_times_cases_doubled)
+    return number_times_cases_doubled, true_cases_today
+
+
+def baseline_series(case_factor, true_cases_today, number_times_cases_doubled,
+                    sim_days):
+    # The per-day loop of build_bar_charts and plot_barline_combo before the
+    # engine was vectorized: lag-adjusted counts, one per day.
+    true_cases_list = [true_cases_today]
+    for day_num in range(1, sim_days+1):
+        true_cases_list.append(round(true_cases_today * 2**(day_num / number_times_cases_doubled)))
+    num_cases_list = [round(case_factor*i) for i in true_cases_list]
+    num_cases_arr = np.array(num_cases_list)
+    num_new_cases_arr = np.array(num_cases_list[1:]+[0]) - num_cases_arr
+    num_new_cases_arr = np.append(num_new_cases_arr[:-1], num_new_cases_arr[-1])
+    num_cases_arr[10:] = num_cases_arr[10:] - num_new_cases_arr[:-10]
+    return num_cases_arr
+
+
+def baseline_crossing(num_cases_arr, num_capacity):
+    for bar_idx in range(len(num_cases_arr)):
+        if num_cases_arr[bar_idx] > num_capacity:
+            return bar_idx
+    return -1
+
+
+def random_inputs(rng):
+    # The eleven dashboard inputs in callback order, in the ranges of the
+    # dcc.Input boxes; clientside_parity checks the same scenarios. Scenarios
+    # whose counts go past 2**53, where doubles stop being exact integers,
+    # are skipped. Integral floats are ints, as the browser sends them.
+    while True:
+        inputs = [rng.randint(1, 100000), round(rng.uniform(0.1, 100), 1),
+                  round(rng.uniform(1, 100), 1), round(rng.uniform(1, 50), 2),
+                  rng.randint(50, 10000000), rng.randint(1, 1000000),
+                  rng.randint(1, 500000), rng.randint(3, 90),
+                  rng.randint(1, 50), round(rng.uniform(0.5, 20), 1),
+                  round(rng.uniform(0.1, 10), 1)]
+        inputs = [int(v) if float(v).is_integer() else v for v in inputs]
+        number_times_cases_doubled, true_cases_today = \
+            baseline_metrics(*inputs[:4])
+        if (math.log2(max(true_cases_today, 1)) +
+                inputs[7] / number_times_cases_doubled < 52):
+            return inputs
+
+
+def random_scenario(rng):
+    inputs = random_inputs(rng)
+    number_times_cases_doubled, true_cases_today = \
+        baseline_metrics(*inputs[:4])
+    return (true_cases_today, number_times_cases_doubled, inputs[7],
+            inputs[8:], inputs[4:7])
+
+
+def check_baseline(scenario):
+    # project() and shortage_day() against the per-day loop, with the
+    # default lag and with the 10-day rule given as a kernel.
+    true_cases_today, n, sim_days, pcts, capacities = scenario
+    ten_days = stay_kernel('10')
+    projected = project(true_cases_today, n, sim_days, *pcts)
+    kernel_projected = project(true_cases_today, n, sim_days, *pcts,
+                               kernels={name: ten_days for name in SERIES})
+    problems = []
+    for name, pct, capacity in zip(SERIES, pcts, capacities):
+        expected = baseline_series(pct/100, true_cases_today, n, sim_days)
+        if not np.array_equal(projected[name], expected):
+            problems.append('project {}'.format(name))
+        if not np.array_equal(kernel_projected[name], expected):
+            problems.append('project kernel 10 {}'.format(name))
+        crossed = baseline_crossing(expected, capacity)
+        for kernel in (None, ten_days):
+            found = shortage_day(np.array([float(true_cases_today)]),
+                                 np.array([n]), np.array([pct/100]),
+                                 np.array([float(capacity)]), sim_days, kernel)
+            if found[0] != crossed:
+                problems.append('shortage_day {} {} != {}'.format(
+                    name, found[0], crossed))
+    return problems
+
+
+def random_batch(rng, size):
+    # Vectorized scenarios in the dashboard's ranges, within 2**53.
+    total_deaths = rng.integers(1, 100000, size, endpoint=True)
+    fatality_rate = np.round(rng.uniform(0.1, 100, size), 1)
+    days_death = np.round(rng.uniform(1, 100, size), 1)
+    doubling_time = np.round(rng.uniform(1, 50, size), 2)
+    _, n, true_cases_today = calc_metrics_batch(
+        total_deaths, fatality_rate, days_death, doubling_time)
+    case_factor = np.round(rng.uniform(0.1, 50, size), 1) / 100
+    capacity = np.round(10**rng.uniform(0, 7, size))
+    return true_cases_today, n, case_factor, capacity
+
+
+def check_batch(rng, size, sim_days):
+    # lagged_counts() and shortage_day() against first_crossing(lag_adjust())
+    # on project()'s series, for every kernel. Returns mismatches per check.
+    true_cases_today, n, case_factor, capacity = random_batch(rng, size)
+    fits = np.log2(np.maximum(true_cases_today, 1)) + sim_days / n < 52
+    true_cases_today, n = true_cases_today[fits], n[fits]
+    case_factor, capacity = case_factor[fits], capacity[fits]
+    num_cases = as_counts(resource_series(
+        case_factor, true_cases_series(true_cases_today, n, sim_days)))
+    days = np.broadcast_to(np.arange(sim_days+1), num_cases.shape)
+    problems = {}
+    for spec in KERNEL_SPECS:
+        kernel = stay_kernel(spec)
+        expected = lag_adjust(num_cases, kernel=kernel)
+        found = lagged_counts(true_cases_today, n, case_factor, days, kernel)
+        problems['lagged_counts {}'.format(spec)] = int(
+            (found != expected).any(axis=-1).sum())
+        found = shortage_day(true_cases_today, n, case_factor, capacity,
+                             sim_days, kernel)
+        problems['shortage_day {}'.format(spec)] = int(
+            (found != first_crossing(expected, capacity)).sum())
+    return len(true_cases_today), problems
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Check the vectorized shortage solver and stay kernels '
+                    'against the per-day loop and the full series.')
+    parser.add_argument('-n', '--scenarios', type=int, default=500,
+                        help='scenarios checked against the per-day loop')
+    parser.add_argument('--batch', type=int, default=20000,
+                        help='scenarios per horizon checked against the '
+                             'full series')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mismatches = 0
+    for _ in range(args.scenarios):
+        scenario = random_scenario(rng)
+        problems = check_baseline(scenario)
+        if problems:
+            mismatches += 1
+            print('MISMATCH {}: {}'.format(scenario, '; '.join(problems)))
+    print('{} scenarios against the per-day loop, {} mismatches'.format(
+        args.scenarios, mismatches))
+
+    np_rng = np.random.default_rng(args.seed)
+    checked = batch_mismatches = 0
+    for sim_days in (5, 30, 90, 365):
+        size, problems = check_batch(np_rng, args.batch, sim_days)
+        checked += size
+        for name, count in problems.items():
+            if count:
+                print('MISMATCH {} days, {}: {} scenarios'.format(
+                    sim_days, name, count))
+            batch_mismatches += count
+    print('{} scenarios against the full series, {} mismatches'.format(
+        checked, batch_mismatches))
+    return 1 if mismatches or batch_mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
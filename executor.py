@@ -0,0 +1,121 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+class ExecutorTimeout(Exception):
+    pass
+
+
+def _warm():
+    return os.getpid()
+
+
+class InlineExecutor:
+    # Runs every task in the calling thread; the default when no pool is
+    # configured.
+
+    def offloads(self, cost):
+        return False
+
+    def run(self, fn, *args):
+        return fn(*args)
+
+    def warm(self):
+        pass
+
+    def stats(self):
+        return {'processes': 0, 'in_flight': 0, 'submitted': 0,
+                'rejected': 0, 'timeouts': 0}
+
+
+class PoolExecutor:
+    # Offloads tasks above inline_max_cost to a process pool. At most
+    # processes + max_queue tasks are admitted at once; beyond that run()
+    # raises ExecutorBusy straight away instead of queueing the request.
+
+    def __init__(self, processes, max_queue=8, timeout=30,
+                 inline_max_cost=10000):
+        self.processes = processes
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.inline_max_cost = inline_max_cost
+        self._slots = threading.BoundedSemaphore(processes + max_queue)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def offloads(self, cost):
+        return cost > self.inline_max_cost
+
+    def pool(self):
+        # Created on first use in each process, so a pool is never inherited
+        # across a fork (gunicorn --preload).
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.processes)
+                self._pid = os.getpid()
+            return self._pool
+
+    def warm(self):
+        # Start every worker now rather than on the first heavy request.
+        pool = self.pool()
+        for future in [pool.submit(_warm) for _ in range(self.processes)]:
+            future.result()
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy()
+        try:
+            future = self.pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_flight += 1
+            self.submitted += 1
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time.
+            with self._lock:
+                self._pool = None
+            raise
+        except FutureTimeout:
+            # A task that already started cannot be stopped; it keeps its
+            # slot until it finishes, which is what limits the backlog.
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise ExecutorTimeout()
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {'processes': self.processes, 'in_flight': self.in_flight,
+                    'submitted': self.submitted, 'rejected': self.rejected,
+                    'timeouts': self.timeouts}
+
+
+def make_executor(processes, max_queue, timeout, inline_max_cost):
+    if processes <= 0:
+        return InlineExecutor()
+    return PoolExecutor(processes, max_queue=max_queue, timeout=timeout,
+                        inline_max_cost=inline_max_cost)
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+import numpy as np
+
+from projection import LAG_DAYS, calc_metrics_batch, lagged_counts, resource_counts
+from sweep import DEFAULT_INPUTS, RESOURCES, SERIES
+
+
+# Days computed and written at a time, per scenario.
+EXPORT_BLOCK_DAYS = 1024
+
+# Resource columns follow sweep.RESOURCES order.
+COLUMNS = [
+    'scenario', 'day', 'date', 'lag_date', 'true_cases',
+    'hospitalizations', 'hospitalizations_adjusted', 'bed_shortage',
+    'icus', 'icus_adjusted', 'icu_shortage',
+    'ventilators', 'ventilators_adjusted', 'ventilator_shortage',
+]
+
+
+def scenario_inputs(scenarios):
+    # scenarios is a list of parameter dicts; missing parameters take the
+    # dashboard defaults. Returns one float64 array per DEFAULT_INPUTS name.
+    for scenario in scenarios:
+        unknown = set(scenario) - set(DEFAULT_INPUTS)
+        if unknown:
+            raise ValueError('Unknown scenario parameters: {}'.format(
+                ', '.join(sorted(unknown))))
+    return {name: np.array([scenario.get(name, value) for scenario in scenarios],
+                           dtype=np.float64)
+            for name, value in DEFAULT_INPUTS.items()}
+
+
+def export_blocks(scenarios, sim_days, date_today, block_days=EXPORT_BLOCK_DAYS,
+                  kernels=None):
+    # Yields lists of rows, one list per block of at most block_days days of
+    # one scenario, so memory use does not grow with the horizon or the
+    # number of scenarios. The series are the ones plot_totals and
+    # plot_barline_combo draw; <resource>_adjusted is the bar height and
+    # <resource>_shortage whether it is above capacity. Counts that overflow
+    # are None. kernels maps series names to stay kernels, as in project().
+    kernels = kernels or {}
+    inputs = scenario_inputs(scenarios)
+    _, number_times_cases_doubled, true_cases_today = \
+        calc_metrics_batch(inputs['total_deaths'], inputs['fatality_rate'],
+                           inputs['days_death'], inputs['doubling_time'])
+    for scenario in range(len(true_cases_today)):
+        rows = slice(scenario, scenario+1)
+        for start in range(0, sim_days+1, block_days):
+            days = np.arange(start, min(start+block_days, sim_days+1))[np.newaxis]
+            columns = [resource_counts(true_cases_today[rows],
+                                       number_times_cases_doubled[rows],
+                                       np.ones(1), days)[0]]
+            for (_, pct, capacity), series in zip(RESOURCES, SERIES):
+                case_factor = inputs[pct][rows]/100
+                adjusted = lagged_counts(true_cases_today[rows],
+                                         number_times_cases_doubled[rows],
+                                         case_factor, days,
+                                         kernels.get(series))[0]
+                columns += [resource_counts(true_cases_today[rows],
+                                            number_times_cases_doubled[rows],
+                                            case_factor, days)[0],
+                            adjusted, adjusted > inputs[capacity][scenario]]
+            columns = [[value if not isinstance(value, float) or
+                        np.isfinite(value) else None
+                        for value in column.tolist()] for column in columns]
+            yield [[scenario, day, (date_today + timedelta(day)).isoformat(),
+                    (date_today + timedelta(day + LAG_DAYS)).isoformat()] +
+                   list(values)
+                   for day, values in zip(days[0].tolist(), zip(*columns))]
+
+
+def export_csv(scenarios, sim_days, date_today, block_days=EXPORT_BLOCK_DAYS,
+               kernels=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    for block in export_blocks(scenarios, sim_days, date_today, block_days,
+                               kernels):
+        writer.writerows(block)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_ndjson(scenarios, sim_days, date_today, block_days=EXPORT_BLOCK_DAYS,
+                  kernels=None):
+    for block in export_blocks(scenarios, sim_days, date_today, block_days,
+                               kernels):
+        yield ''.join(json.dumps(dict(zip(COLUMNS, row))) + '\n' for row in block)
+
+
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+}
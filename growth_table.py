@@ -0,0 +1,87 @@
+import math
+import os
+import threading
+
+import numpy as np
+
+from paths import check_private, private_dir, source_digest, write_atomic
+
+
+# number_times_cases_doubled is rounded to 2 decimals, and the input bounds
+# (days to death 1-100, doubling time 1-50) keep it at or below 100, so a row
+# per hundredth covers every input. Columns are days 0-90, the sim-days range.
+TABLE_MAX_DOUBLINGS = 100
+TABLE_STEPS = 100
+TABLE_MAX_DAYS = 90
+
+_table = None
+_path = None
+_lock = threading.Lock()
+
+
+def default_path():
+    # The shape and a digest of this module are in the name, so a changed
+    # table never reads an old file.
+    return os.path.join(private_dir(), 'growth-{}x{}-{}.npy'.format(
+        TABLE_MAX_DOUBLINGS*TABLE_STEPS + 1, TABLE_MAX_DAYS + 1,
+        source_digest(__file__)))
+
+
+def build_table():
+    # Row i holds 2**(day/n) for n = i/100, computed exactly as
+    # projection.true_cases_series does, so scaling a row by true_cases_today
+    # gives bit-identical results. Row 0 (n = 0) is unused.
+    n = np.arange(TABLE_MAX_DOUBLINGS*TABLE_STEPS + 1) / TABLE_STEPS
+    day_nums = np.arange(TABLE_MAX_DAYS+1)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        return np.float_power(2, day_nums / n[:, np.newaxis])
+
+
+def load(path=None):
+    # Maps the table file read-only, building it first if it is missing. The
+    # mapping is backed by the page cache, so every worker process on the
+    # machine shares one copy. A file another user could have written is
+    # refused.
+    global _table
+    path = path or default_path()
+    with _lock:
+        if _table is None:
+            if not os.path.exists(path):
+                write_atomic(path, lambda f: np.save(f, build_table()),
+                             binary=True)
+            check_private(path)
+            _table = np.load(path, mmap_mode='r')
+        return _table
+
+
+def configure(path=None):
+    # Load the table on first use instead of now.
+    global _path
+    _path = path or default_path()
+
+
+def growth_factors(number_times_cases_doubled, sim_days):
+    # Rows of 2**(day/n) for days 0..sim_days, or None when the table is not
+    # loaded or configured, or does not cover the request.
+    table = _table
+    if table is None and _path is not None:
+        table = load(_path)
+    if table is None or sim_days > TABLE_MAX_DAYS:
+        return None
+    if np.ndim(number_times_cases_doubled) == 0:
+        n = float(number_times_cases_doubled)
+        idx = round(n * TABLE_STEPS) if math.isfinite(n) else 0
+        if 1 <= idx <= TABLE_MAX_DOUBLINGS*TABLE_STEPS and idx / TABLE_STEPS == n:
+            return table[idx, :sim_days+1]
+        return None
+    number_times_cases_doubled = np.asarray(number_times_cases_doubled,
+                                            dtype=np.float64)
+    idx = np.rint(number_times_cases_doubled * TABLE_STEPS)
+    if not (np.isfinite(idx).all() and (idx >= 1).all() and
+            (idx <= TABLE_MAX_DOUBLINGS*TABLE_STEPS).all()):
+        return None
+    idx = idx.astype(np.int64)
+    # n must be exactly i/100, not merely close, for the rows to be exact.
+    if not (idx / TABLE_STEPS == number_times_cases_doubled).all():
+        return None
+    return table[idx, :sim_days+1]
@@ -0,0 +1,21 @@
+# gunicorn main:server -c gunicorn.conf.py
+#
+# The worker class and its concurrency come from settings.py. Every callback
+# only reads module-level state; the shared caches, metrics and coalescer
+# take their own locks, so threads and greenlets can share a worker.
+import settings
+
+
+worker_class = settings.SERVER_WORKER_CLASS
+workers = settings.SERVER_WORKERS
+timeout = settings.SERVER_TIMEOUT
+if settings.EXECUTOR_PROCESSES and settings.EXECUTOR_TIMEOUT >= timeout:
+    # The worker would be killed while waiting for the pool, and the client
+    # would get a dropped connection instead of the busy notice.
+    raise ValueError('EXECUTOR_TIMEOUT ({:g}s) must be lower than '
+                     'SERVER_TIMEOUT ({}s)'.format(settings.EXECUTOR_TIMEOUT,
+                                                   timeout))
+if worker_class == 'gthread':
+    threads = settings.SERVER_THREADS
+elif worker_class == 'gevent':
+    worker_connections = settings.SERVER_WORKER_CONNECTIONS
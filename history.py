@@ -0,0 +1,291 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from paths import write_atomic
+from projection import calc_metrics_batch, true_cases_series
+from sweep import DEFAULT_INPUTS
+
+
+# Days ahead stored with each projection and compared in back-tests.
+DEFAULT_HORIZON = 30
+# Regions back-tested at a time; each holds dates x horizon values.
+BACKTEST_CHUNK_REGIONS = 256
+
+MODEL_INPUTS = ('fatality_rate', 'days_death', 'doubling_time')
+
+# Layout of the record files; a store of another version is refused.
+STORE_VERSION = 2
+
+# Regions are stored as indexes into the store's regions.json name list.
+DEATHS_DTYPE = np.dtype([('region', '<i4'), ('date', '<M8[D]'),
+                         ('total_deaths', '<f8')])
+
+
+def projections_dtype(horizon):
+    # One projection run: the region, the day of the death count it started
+    # from, the rates used and the true cases for days 0..horizon.
+    return np.dtype([('region', '<i4'), ('made_on', '<M8[D]'),
+                     ('fatality_rate', '<f8'), ('days_death', '<f8'),
+                     ('doubling_time', '<f8'), ('true_cases', '<f8', (horizon+1,))])
+
+
+class HistoryStore:
+    # A directory of append-only record files, read back memory-mapped.
+    # Records are only ever added; a death count or projection appended
+    # again for the same region and day replaces the earlier one when read. Region names of any
+    # length are kept in regions.json and referred to by their position.
+    # One writer at a time.
+
+    def __init__(self, path, horizon=DEFAULT_HORIZON):
+        self.path = path
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('version') != STORE_VERSION:
+                raise ValueError('{} was written by another version of '
+                                 'history.py'.format(path))
+            horizon = meta['horizon']
+        else:
+            os.makedirs(path, exist_ok=True)
+            with open(meta_path, 'w') as f:
+                json.dump({'version': STORE_VERSION, 'horizon': horizon}, f)
+        self.horizon = horizon
+        self.projection_dtype = projections_dtype(horizon)
+        names_path = os.path.join(path, 'regions.json')
+        self.names = []
+        if os.path.exists(names_path):
+            with open(names_path, encoding='utf-8') as f:
+                self.names = json.load(f)
+        self._ids = {name: i for i, name in enumerate(self.names)}
+
+    def region_ids(self, regions, add=False):
+        # Index of each region name, -1 for unknown ones unless add, which
+        # records them first so no record ever refers to a missing name.
+        regions = [str(region) for region in regions]
+        new = [name for name in dict.fromkeys(regions) if name not in self._ids]
+        if add and new:
+            for name in new:
+                self._ids[name] = len(self.names)
+                self.names.append(name)
+            names_path = os.path.join(self.path, 'regions.json')
+            write_atomic(names_path, lambda f: json.dump(
+                self.names, f, ensure_ascii=False))
+        return np.array([self._ids.get(name, -1) for name in regions],
+                        dtype=np.int32)
+
+    def region_names(self, ids):
+        return np.array(self.names, dtype=object)[np.asarray(ids, dtype=np.int64)]
+
+    def _append(self, name, records):
+        with open(os.path.join(self.path, name), 'ab') as f:
+            f.write(records.tobytes())
+
+    def _read(self, name, dtype):
+        # A record cut short by an interrupted append is ignored.
+        path = os.path.join(self.path, name)
+        count = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+        if not count:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+    def append_deaths(self, regions, dates, total_deaths):
+        records = np.empty(len(regions), dtype=DEATHS_DTYPE)
+        records['region'] = self.region_ids(regions, add=True)
+        records['date'] = np.asarray(dates, dtype='M8[D]')
+        records['total_deaths'] = total_deaths
+        self._append('deaths.bin', records)
+
+    def deaths(self):
+        return self._read('deaths.bin', DEATHS_DTYPE)
+
+    def append_projections(self, records):
+        self._append('projections.bin', records.astype(self.projection_dtype))
+
+    def projections(self):
+        # Runs made again for a corrected day replace the earlier ones.
+        return latest(self._read('projections.bin', self.projection_dtype),
+                      'made_on')
+
+    def death_matrix(self):
+        # Returns region names, consecutive dates and a regions x dates
+        # array of death counts, NaN where a day is missing.
+        deaths = latest(self.deaths(), 'date')
+        if not len(deaths):
+            return (np.empty(0, dtype=object), np.empty(0, dtype='M8[D]'),
+                    np.empty((0, 0)))
+        region_ids, region_idx = np.unique(deaths['region'], return_inverse=True)
+        first = deaths['date'].min()
+        dates = np.arange(first, deaths['date'].max() + 1)
+        matrix = np.full((len(region_ids), len(dates)), np.nan)
+        matrix[region_idx, (deaths['date'] - first).astype(np.int64)] = \
+            deaths['total_deaths']
+        return self.region_names(region_ids), dates, matrix
+
+
+def latest(records, day_field):
+    # The last record written for each region and day. A record appended
+    # again for the same region and day corrects the earlier one: a stable
+    # sort by (region, day) keeps the order they were written in, and the
+    # last of each run is kept.
+    order = np.lexsort((records[day_field], records['region']))
+    records = records[order]
+    last = np.ones(len(records), dtype=bool)
+    last[:-1] = ((records['region'][1:] != records['region'][:-1]) |
+                 (records[day_field][1:] != records[day_field][:-1]))
+    return records[last]
+
+
+def model_inputs(params, count):
+    # Rates for count runs: dashboard defaults unless given in params.
+    params = params or {}
+    return {name: np.broadcast_to(np.asarray(params.get(name, DEFAULT_INPUTS[name]),
+                                             dtype=np.float64), (count,))
+            for name in MODEL_INPUTS}
+
+
+def project_runs(total_deaths, inputs, horizon):
+    # True cases today and the projected true cases for days 0..horizon, one
+    # row per run, as the dashboard computes them.
+    _, number_times_cases_doubled, true_cases_today = calc_metrics_batch(
+        total_deaths, inputs['fatality_rate'], inputs['days_death'],
+        inputs['doubling_time'])
+    with np.errstate(invalid='ignore'):
+        true_cases = true_cases_series(true_cases_today,
+                                       number_times_cases_doubled, horizon)
+    return true_cases_today, true_cases
+
+
+def daily_update(store, date, regions, total_deaths, params=None):
+    # Records one day of death counts, projects from them and compares the
+    # day's estimate of true cases with what every stored projection made in
+    # the previous store.horizon days forecast for it. Only the new day is
+    # computed, and the comparison is complete before anything is written.
+    date = np.datetime64(date, 'D')
+    regions = [str(region) for region in regions]
+    region_ids = store.region_ids(regions)
+    total_deaths = np.asarray(total_deaths, dtype=np.float64)
+    inputs = model_inputs(params, len(regions))
+    true_cases_today, true_cases = project_runs(total_deaths, inputs,
+                                                store.horizon)
+
+    earlier = store.projections()
+    days_ahead = (date - earlier['made_on']).astype(np.int64)
+    earlier_idx = np.flatnonzero((days_ahead >= 1) &
+                                 (days_ahead <= store.horizon) &
+                                 np.isin(earlier['region'],
+                                         region_ids[region_ids >= 0]))
+    position = {region: i for i, region in enumerate(region_ids)}
+    today_idx = np.array([position[r] for r in earlier['region'][earlier_idx]],
+                         dtype=np.int64)
+    forecast = earlier['true_cases'][earlier_idx, days_ahead[earlier_idx]]
+    nowcast = true_cases_today[today_idx]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error_pct = (forecast - nowcast) / nowcast * 100
+    comparison = pd.DataFrame({
+        'region': store.region_names(earlier['region'][earlier_idx]),
+        'made_on': earlier['made_on'][earlier_idx],
+        'days_ahead': days_ahead[earlier_idx],
+        'forecast_true_cases': forecast,
+        'true_cases': nowcast,
+        'error_pct': error_pct,
+    })
+
+    store.append_deaths(regions, np.full(len(regions), date), total_deaths)
+    records = np.empty(len(regions), dtype=store.projection_dtype)
+    records['region'] = store.region_ids(regions)
+    records['made_on'] = date
+    for name in MODEL_INPUTS:
+        records[name] = inputs[name]
+    records['true_cases'] = true_cases
+    store.append_projections(records)
+    return comparison
+
+
+def backtest(store, params=None, horizon=None,
+             chunk_regions=BACKTEST_CHUNK_REGIONS):
+    # Re-runs a projection from every stored day of every region with the
+    # given rates and scores each forecast against the estimate made from
+    # the deaths on the day it was for. All days of a chunk of regions are
+    # projected in one array operation. Returns one row per days ahead.
+    horizon = store.horizon if horizon is None else horizon
+    regions, dates, deaths = store.death_matrix()
+    count = np.zeros(horizon+1, dtype=np.int64)
+    abs_error = np.zeros(horizon+1)
+    error = np.zeros(horizon+1)
+    for start in range(0, len(regions), chunk_regions):
+        chunk = deaths[start:start+chunk_regions]
+        inputs = model_inputs(params, chunk.size)
+        nowcast, forecast = project_runs(chunk.ravel(), inputs, horizon)
+        nowcast = nowcast.reshape(chunk.shape)
+        forecast = forecast.reshape(chunk.shape + (horizon+1,))
+        # actual[r, t, h] is the estimate made h days after day t.
+        padded = np.pad(nowcast, ((0, 0), (0, horizon)), constant_values=np.nan)
+        window = np.arange(len(dates))[:, np.newaxis] + np.arange(horizon+1)
+        actual = padded[:, window]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            error_pct = (forecast - actual) / actual * 100
+        scored = np.isfinite(error_pct)
+        count += scored.sum(axis=(0, 1))
+        abs_error += np.where(scored, np.abs(error_pct), 0).sum(axis=(0, 1))
+        error += np.where(scored, error_pct, 0).sum(axis=(0, 1))
+    # Day 0 is the estimate itself and always matches.
+    with np.errstate(invalid='ignore'):
+        return pd.DataFrame({
+            'days_ahead': np.arange(1, horizon+1),
+            'forecasts': count[1:],
+            'mean_abs_error_pct': abs_error[1:] / count[1:],
+            'mean_error_pct': error[1:] / count[1:],
+        })
+
+
+def read_feed(path):
+    # CSV with region, date and total_deaths (or deaths) columns.
+    feed = pd.read_csv(path).rename(columns={'deaths': 'total_deaths'})
+    feed['date'] = pd.to_datetime(feed['date']).dt.date
+    return feed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Keep a history of daily death counts and projections '
+                    'per region, and back-test the projections against it.')
+    parser.add_argument('--store', default='history',
+                        help='history directory, created if missing')
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON,
+                        help='days projected per run for a new store')
+    commands = parser.add_subparsers(dest='command', required=True)
+    update = commands.add_parser(
+        'update', help='add a death feed day by day and print how earlier '
+                       'forecasts compare')
+    update.add_argument('feed', help='CSV with region, date and total_deaths')
+    backtest_parser = commands.add_parser(
+        'backtest', help='score projections from every stored day')
+    for command in (update, backtest_parser):
+        for name in MODEL_INPUTS:
+            command.add_argument('--' + name.replace('_', '-'), type=float,
+                                 default=DEFAULT_INPUTS[name])
+        command.add_argument('--out', default='-',
+                             help='output CSV path, - for stdout')
+    args = parser.parse_args()
+
+    store = HistoryStore(args.store, horizon=args.horizon)
+    params = {name: getattr(args, name) for name in MODEL_INPUTS}
+    if args.command == 'update':
+        feed = read_feed(args.feed)
+        result = pd.concat([daily_update(store, date, day['region'],
+                                         day['total_deaths'], params)
+                            for date, day in feed.groupby('date', sort=True)],
+                           ignore_index=True)
+    else:
+        result = backtest(store, params)
+    result.to_csv(sys.stdout if args.out == '-' else args.out, index=False)
+
+
+if __name__ == '__main__':
+    main()
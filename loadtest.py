@@ -0,0 +1,276 @@
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+# Inputs sent with every request; doubling_time and sim-days are varied to
+# give --distinct different simulations, so the cache hit rate is tunable.
+BASE_INPUTS = {
+    'total-deaths': 2, 'fatality-rate': 5, 'days-death': 17.3,
+    'doubling-time': 6.18, 'num-beds': 50000, 'num-icus': 10000,
+    'num-ventilators': 1000, 'sim-days': 30, 'pct-hospitalization': 20,
+    'pct-icu': 5, 'pct-ventilator': 1, 'uncertainty-pct': 0,
+    'model': 'doubling', 'input-spreads': '', 'simulation-inputs': None,
+}
+
+UPDATE_PATH = '/_dash-update-component'
+
+
+def request(conn, method, path, body=None, cookies=None):
+    # cookies, when given, is the client's cookie jar: sent with the request
+    # and updated from Set-Cookie, as a browser session would.
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    if cookies:
+        headers['Cookie'] = '; '.join('{}={}'.format(*c) for c in cookies.items())
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    if cookies is not None:
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, value = header.split(';', 1)[0].partition('=')
+            cookies[name.strip()] = value
+    return response.status, response.read()
+
+
+def output_spec(output):
+    # 'id.prop' for one output, '..id.prop...id.prop..' for several.
+    outputs = [dict(zip(('id', 'property'), o.split('.')))
+               for o in output.strip('.').split('...')]
+    return outputs if output.startswith('..') else outputs[0]
+
+
+def submit_bodies(host, port, distinct):
+    # Request bodies for every server callback fired by submit-button, built
+    # from the app's own dependency list so they follow its callback mode.
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    status, data = request(conn, 'GET', '/_dash-dependencies')
+    conn.close()
+    assert status == 200, status
+    dependencies = [d for d in json.loads(data)
+                    if not d.get('clientside_function') and
+                    any(i['id'] == 'submit-button' for i in d['inputs'])]
+    scenarios = []
+    for i in range(distinct):
+        values = dict(BASE_INPUTS)
+        values['doubling-time'] = round(3 + 0.01*i, 2)
+        values['sim-days'] = 30 + i % 61
+        scenarios.append([json.dumps({
+            'output': d['output'],
+            'outputs': output_spec(d['output']),
+            'inputs': [dict(i, value=1 if i['id'] == 'submit-button' else
+                            values[i['id']]) for i in d['inputs']],
+            'changedPropIds': ['submit-button.n_clicks'],
+            'state': [dict(s, value=values[s['id']]) for s in d['state']],
+        }).encode() for d in dependencies])
+    return scenarios
+
+
+def reference_digests(host, port, scenarios):
+    # Answers computed one at a time before the load starts; every answer
+    # under load must match them byte for byte.
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    cookies = {}
+    digests = {}
+    for bodies in scenarios:
+        for body in bodies:
+            status, data = request(conn, 'POST', UPDATE_PATH, body, cookies)
+            assert status == 200, status
+            digests[body] = hashlib.sha1(data).digest()
+    conn.close()
+    return digests
+
+
+def client_loop(host, port, scenarios, digests, deadline, offset, stats, lock):
+    # One keep-alive connection and session sending a whole submit (all its
+    # callbacks) at a time; the latency recorded is per callback request.
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    cookies = {}
+    # Load the page first, as a browser would, to get a session cookie.
+    request(conn, 'GET', '/', cookies=cookies)
+    i = offset
+    latencies = []
+    errors = mismatches = 0
+    while time.perf_counter() < deadline:
+        for body in scenarios[i % len(scenarios)]:
+            start = time.perf_counter()
+            try:
+                status, data = request(conn, 'POST', UPDATE_PATH, body,
+                                       cookies)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=60)
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+            elif hashlib.sha1(data).digest() != digests[body]:
+                mismatches += 1
+        i += 1
+    conn.close()
+    with lock:
+        stats['latencies'] += latencies
+        stats['errors'] += errors
+        stats['mismatches'] += mismatches
+
+
+def slow_client_loop(host, port, body, slow_seconds, deadline):
+    # Sends a request a few bytes at a time over slow_seconds, like a client
+    # on a poor connection, then reads the answer slowly as well.
+    head = ('POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n'
+            'Content-Length: {}\r\nConnection: close\r\n\r\n').format(
+                UPDATE_PATH, host, len(body)).encode()
+    payload = head + body
+    pieces = 20
+    while time.perf_counter() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=60) as sock:
+                step = -(-len(payload) // pieces)
+                for start in range(0, len(payload), step):
+                    sock.sendall(payload[start:start+step])
+                    time.sleep(slow_seconds / pieces)
+                while sock.recv(1024):
+                    time.sleep(slow_seconds / pieces)
+        except OSError:
+            time.sleep(0.1)
+
+
+def run_load(url, concurrency, duration, distinct, slow_clients, slow_seconds):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    scenarios = submit_bodies(host, port, distinct)
+    digests = reference_digests(host, port, scenarios)
+    stats = {'latencies': [], 'errors': 0, 'mismatches': 0}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration
+    threads = [threading.Thread(target=slow_client_loop,
+                                args=(host, port, scenarios[0][0],
+                                      slow_seconds, deadline), daemon=True)
+               for _ in range(slow_clients)]
+    threads += [threading.Thread(target=client_loop,
+                                 args=(host, port, scenarios, digests,
+                                       deadline, i, stats, lock))
+                for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads[slow_clients:]:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(stats['latencies'])
+
+    def percentile(q):
+        if not latencies:
+            return None
+        return latencies[min(int(q/100 * len(latencies)), len(latencies)-1)] * 1e3
+
+    return {
+        'requests': len(latencies),
+        'errors': stats['errors'],
+        'mismatches': stats['mismatches'],
+        'throughput_rps': len(latencies) / elapsed,
+        'latency_ms': {
+            'mean': statistics.mean(latencies) * 1e3 if latencies else None,
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+            'max': latencies[-1] * 1e3 if latencies else None,
+        },
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(worker_class, workers, threads, port):
+    # gunicorn with gunicorn.conf.py, configured through the same settings
+    # environment variables a deployment would use.
+    env = dict(os.environ, SERVER_WORKER_CLASS=worker_class,
+               SERVER_WORKERS=str(workers), SERVER_THREADS=str(threads))
+    root = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'main:server', '-c',
+         'gunicorn.conf.py', '-b', '127.0.0.1:{}'.format(port)],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            status, _ = request(conn, 'GET', '/')
+            conn.close()
+            if status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn with {} workers did not start'.format(
+        worker_class))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test the dashboard: concurrent simulation requests, '
+                    'optionally alongside slow clients, against a running '
+                    'instance or against local gunicorn servers of each '
+                    'worker class. Every answer is checked against one '
+                    'computed without concurrency.')
+    parser.add_argument('--url', help='test this running instance instead of '
+                                      'starting local servers')
+    parser.add_argument('--worker-class', nargs='+',
+                        default=['sync', 'gthread'],
+                        help='gunicorn worker classes to start and compare')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8,
+                        help='threads per worker for gthread')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds of load per server')
+    parser.add_argument('--distinct', type=int, default=50,
+                        help='distinct simulations in the request mix')
+    parser.add_argument('--slow-clients', type=int, default=0)
+    parser.add_argument('--slow-seconds', type=float, default=2,
+                        help='time each slow client takes to send its request')
+    parser.add_argument('--out', default='-',
+                        help='output JSON path, - for stdout')
+    args = parser.parse_args()
+
+    load_args = (args.concurrency, args.duration, args.distinct,
+                 args.slow_clients, args.slow_seconds)
+    report = {'concurrency': args.concurrency, 'duration_s': args.duration,
+              'distinct': args.distinct, 'slow_clients': args.slow_clients,
+              'results': []}
+    if args.url:
+        report['results'].append(dict(run_load(args.url, *load_args),
+                                      url=args.url))
+    for worker_class in [] if args.url else args.worker_class:
+        port = free_port()
+        process = start_server(worker_class, args.workers, args.threads, port)
+        try:
+            result = run_load('http://127.0.0.1:{}'.format(port), *load_args)
+        finally:
+            process.terminate()
+            process.wait()
+        report['results'].append(dict(result, worker_class=worker_class,
+                                      workers=args.workers))
+
+    output = json.dumps(report, indent=2)
+    if args.out == '-':
+        print(output)
+    else:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,74 @@
 from datetime import datetime as dt
-from datetime import timedelta
+import base64
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import secrets
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output, State
-import dash_table
-import pandas as pd
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 import numpy as np
-import plotly.graph_objects as go
+import plotly.utils
+from flask import Response, jsonify, request, stream_with_context
+
+import settings
+from cache import (SharedResultStore, SimulationCache, TieredCache,
+                   normalize_inputs)
+from coalesce import RequestCoalescer
+from executor import ExecutorBusy, ExecutorTimeout, make_executor
+import growth_table
+from metrics import Registry
+from montecarlo import (format_spreads, input_spreads, parse_spreads,
+                        relative_spread, run_monte_carlo,
+                        shortage_day_percentile)
+from paths import is_private, private_dir, source_digest, write_atomic
+from projection import (as_counts, date_axes, first_crossing, kernel_taps,
+                        project, stay_kernel)
+from seir import project_seir, saturated
 
 
 app = dash.Dash(__name__)
 server = app.server
 
+def result_namespace():
+    # Shared results are only valid for the code and settings that produced
+    # them, so a digest of both prefixes every key. After a deploy the old
+    # entries are no longer read and age out of the store.
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1(plotly.__version__.encode())
+    digest.update(json.dumps({name: getattr(settings, name) for name in dir(settings)
+                              if name.isupper()}, sort_keys=True,
+                             default=str).encode())
+    for path in sorted(glob.glob(os.path.join(root, '*.py')) +
+                       glob.glob(os.path.join(root, 'assets', '*.js'))):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16] + ':'
+
+simulation_cache = SimulationCache(max_entries=settings.SIM_CACHE_MAX_ENTRIES,
+                                   ttl=settings.SIM_CACHE_TTL,
+                                   max_bytes=settings.SIM_CACHE_MAX_BYTES)
+if settings.SHARED_CACHE:
+    simulation_cache = TieredCache(simulation_cache, SharedResultStore(
+        settings.SHARED_CACHE_PATH or os.path.join(private_dir(),
+                                                   'results.sqlite'),
+        namespace=result_namespace(), ttl=settings.SIM_CACHE_TTL,
+        max_bytes=settings.SHARED_CACHE_MAX_BYTES))
+stage_metrics = Registry(enabled=settings.METRICS_ENABLED)
+simulation_executor = make_executor(settings.EXECUTOR_PROCESSES,
+                                    settings.EXECUTOR_MAX_QUEUE,
+                                    settings.EXECUTOR_TIMEOUT,
+                                    settings.EXECUTOR_INLINE_MAX_COST)
+live_requests = RequestCoalescer(delay=settings.LIVE_DEBOUNCE)
+if settings.GROWTH_TABLE and settings.FAST_STARTUP:
+    growth_table.configure(settings.GROWTH_TABLE_PATH)
+elif settings.GROWTH_TABLE:
+    growth_table.load(settings.GROWTH_TABLE_PATH)
+
 app.layout = html.Div([
     html.Div([
         html.Div([
@@ -79,10 +135,33 @@ app.layout = html.Div([
                 html.Div('Simulate for next N days:',
                         style={'margin-bottom': 3, 'margin-top': 15,
                             'font-weight': 'bold'}),
-                html.Div(
+                dcc.Input(
+                        id="sim-days", type="number",
+                        debounce=False, value=30, min=3, max=90),
+                html.Div([
+                    html.Div('Uncertainty in rates (± %):',
+                            style={'margin-bottom': 3, 'margin-top': 15,
+                                'font-weight': 'bold'}),
                     dcc.Input(
-                            id="sim-days", type="number",
-                            debounce=False, value=30, min=3, max=90
+                            id="uncertainty-pct", type="number",
+                            debounce=False, value=0, min=0, max=90),
+                    html.Div('Uncertainty per input (name:± %):',
+                            style={'margin-bottom': 3, 'margin-top': 15,
+                                'font-weight': 'bold'}),
+                    dcc.Input(
+                            id="input-spreads", type="text",
+                            debounce=False, value='',
+                            placeholder='doubling_time:40,pct_icu:50'),
+                ], id='uncertainty-controls'),
+                html.Div('Model:',
+                        style={'margin-bottom': 3, 'margin-top': 15,
+                            'font-weight': 'bold'}),
+                html.Div(
+                    dcc.RadioItems(
+                            id="model",
+                            options=[{'label': 'Case doubling', 'value': 'doubling'},
+                                     {'label': 'Compartmental (SEIR)', 'value': 'seir'}],
+                            value=settings.SIMULATION_MODEL
                     ), style={'margin-bottom': 30}),
                 html.Button(id='submit-button', n_clicks=0, children='Run Simulation',
                         style={'margin-bottom': 0}),
@@ -111,12 +190,14 @@ app.layout = html.Div([
             - The default values of fatality rate, days from infection to death, and case doubling rate are sensible defaults determined by studies on actual data (more details in the article linked above), but feel free to tweak these values as well.
             - Number of cases requiring hospitalizations, ICUs, ventilators have been adjusted by subtracting number of new cases from 10 days prior to account for cases that leave the hospital either due to recovery or death.
             - Note that this is a very simple model that makes a lot of assumptions. Also, this model only shows the outbreak scenarios without accounting for containment, mitigation or other phases of intervention. Hence, the graphs only show infinitely increasing trends. However, this simulation (especially for N<=30 days) gives you an idea about how and when your hospital capacities might be pushed to their limits.
+            - The compartmental (SEIR) model starts from the same true cases today and first grows at the same rate as the doubling model, then slows down as fewer people are left to infect. Patients stay in hospital beds, ICUs and on ventilators for a set number of days on average instead of leaving after exactly 10 days.
             ''')
         ], className='six columns', style={'margin-left': '5%'}),
     ], className='row', style={'margin-top': 20}),
 ], className='eleven columns', style={'margin-top': 50, 'margin-bottom': 100,
     'margin-left': '7.5%'})
 
+@stage_metrics.timed('calc_metrics')
 def calc_metrics(total_deaths, fatality_rate, days_death, doubling_time):
     number_cases_causing_death = round(total_deaths / (fatality_rate/100))
     number_times_cases_doubled = round(days_death / doubling_time, 2)
@@ -125,40 +206,161 @@ def calc_metrics(total_deaths, fatality_rate, days_death, doubling_time):
     return (number_cases_causing_death, number_times_cases_doubled,
             true_cases_today)
 
-def plot_barline_combo(case_factor, true_cases_list, dates_list, num_capacity,
+def cached_metrics(total_deaths, fatality_rate, days_death, doubling_time):
+    key = ('metrics',) + normalize_inputs(
+        (total_deaths, fatality_rate, days_death, doubling_time))
+    return simulation_cache.get_or_compute(
+        key, lambda: calc_metrics(total_deaths, fatality_rate, days_death,
+                                  doubling_time))
+
+def render_children(output_id, build, date_today, inputs):
+    children = build(date_today, *inputs)
+    with stage_metrics.timer('serialize_' + output_id):
+        return json.dumps(children, cls=plotly.utils.PlotlyJSONEncoder)
+
+def cached_children(output_id, inputs, build, offload=False):
+    # The projections are anchored on today's date, so it is part of the key.
+    # Children are stored as serialized JSON, which is what gets sent anyway.
+    # With offload the JSON is produced in simulation_executor's pool; stage
+    # timings from inside the pool are not recorded in this process.
+    date_today = dt.now().date()
+    key = (output_id, date_today.isoformat()) + normalize_inputs(inputs)
+
+    def serialize():
+        if offload:
+            with stage_metrics.timer('offload_' + output_id):
+                return simulation_executor.run(render_children, output_id,
+                                               build, date_today, inputs)
+        return render_children(output_id, build, date_today, inputs)
+
+    payload = simulation_cache.get_or_compute(key, serialize)
+    stage_metrics.observe_bytes(output_id, len(payload))
+    return json.loads(payload)
+
+def chart_layout(**layout):
+    # Layouts are validated by plotly once at import; requests only copy the
+    # skeleton and fill in the per-input parts, skipping figure validation.
+    import plotly.graph_objects as go
+    return go.Figure(layout=dict(title={
+                        'text': '',
+                        'y':0.9,
+                        'x':0.5,
+                        'xanchor': 'center',
+                        'yanchor': 'top',
+                        'font': {'size': 12}},
+                   yaxis_title={'text': '', 'font': {'size': 12}},
+                   transition={'duration': 1000},
+                   margin=dict(l=50,r=30,b=50,t=90),
+                   **layout)).to_plotly_json()['layout']
+
+def cached_chart_layouts(path):
+    # The first go.Figure loads plotly's validators and default template,
+    # about 0.1s of a cold start. The two validated layouts are kept in a JSON
+    # file per plotly version and version of this module, so later starts
+    # skip that and a changed chart_layout() is never served from an old
+    # file. A file another user could have written is not read.
+    version = '{}:{}'.format(plotly.__version__, source_digest(__file__))
+    try:
+        if is_private(path):
+            with open(path) as f:
+                cached = json.load(f)
+            if cached['version'] == version:
+                return cached['totals'], cached['barline']
+    except (OSError, ValueError, KeyError):
+        pass
+    cached = json.dumps({'version': version,
+                         'totals': chart_layout(),
+                         'barline': chart_layout(showlegend=False)},
+                        cls=plotly.utils.PlotlyJSONEncoder)
+    try:
+        write_atomic(path, lambda f: f.write(cached))
+    except OSError:
+        pass
+    cached = json.loads(cached)
+    return cached['totals'], cached['barline']
+
+if settings.FAST_STARTUP:
+    totals_layout, barline_layout = cached_chart_layouts(
+        settings.CHART_LAYOUT_CACHE or os.path.join(private_dir(),
+                                                    'chart-layouts.json'))
+else:
+    totals_layout, barline_layout = chart_layout(), chart_layout(showlegend=False)
+totals_layout['title']['text'] = '<b>Estimation of true number of cases over time</b>'
+totals_layout['yaxis']['title']['text'] = 'Estimated true number of cases'
+
+def slim_template(template):
+    # Only the parts of the default template that bar and line charts use.
+    keep = ('annotationdefaults', 'autotypenumbers', 'colorway', 'font',
+            'hoverlabel', 'hovermode', 'paper_bgcolor', 'plot_bgcolor',
+            'shapedefaults', 'title', 'xaxis', 'yaxis')
+    return {'data': {k: v for k, v in template['data'].items()
+                     if k in ('bar', 'scatter')},
+            'layout': {k: v for k, v in template['layout'].items()
+                       if k in keep}}
+
+if settings.COMPACT_FIGURES:
+    totals_layout['template'] = barline_layout['template'] = \
+        slim_template(totals_layout['template'])
+
+DAY_MS = 24*60*60*1000
+capacity_line_color = totals_layout['template']['layout']['colorway'][1]
+
+def x_values(dates):
+    # In compact mode a trace carries its first date and a one-day step
+    # instead of a full list of dates.
+    if settings.COMPACT_FIGURES:
+        return {'x0': str(dates[0]), 'dx': DAY_MS}
+    return {'x': dates}
+
+def y_values(values):
+    # Typed arrays need plotly.js >= 2.28, hence their own switch.
+    if not settings.COMPACT_TYPED_ARRAYS:
+        return values
+    values = np.asarray(values)
+    if values.dtype.kind == 'i' and np.abs(values).max(initial=0) < 2**31:
+        dtype = 'i4'
+    else:
+        dtype = 'f8'
+    return {'dtype': dtype,
+            'bdata': base64.b64encode(values.astype('<' + dtype).tobytes()
+                                      ).decode('ascii')}
+
+@stage_metrics.timed('plot_totals')
+def plot_totals(dates, true_cases):
+    return {
+        'data': [dict(x_values(dates), type='scatter', y=y_values(true_cases),
+                      line={'width': 2}, mode='lines+markers')],
+        'layout': totals_layout,
+    }
+
+def compact_bars(num_cases_arr, lag_dates, over_capacity, crossed_idx,
+                    bar_name):
+    # Colour comes from two traces split at the threshold rather than a
+    # colour per bar. Bars over capacity are normally a suffix of the series;
+    # otherwise both traces span the full axis with gaps.
+    if crossed_idx < 0 or over_capacity[crossed_idx:].all():
+        split = len(num_cases_arr) if crossed_idx < 0 else crossed_idx
+        parts = [(lag_dates[:split], num_cases_arr[:split], '#636efa'),
+                 (lag_dates[split:], num_cases_arr[split:], '#db1313')]
+    else:
+        num_cases_arr = num_cases_arr.astype(np.float64)
+        parts = [(lag_dates, np.where(over_capacity, np.nan, num_cases_arr),
+                  '#636efa'),
+                 (lag_dates, np.where(over_capacity, num_cases_arr, np.nan),
+                  '#db1313')]
+    return [dict(x_values(dates), type='bar', y=y_values(values), name=bar_name,
+                 marker={'color': color})
+            for dates, values, color in parts if len(dates)]
+
+@stage_metrics.timed('plot_barline_combo')
+def plot_barline_combo(num_cases_arr, lag_dates, num_capacity,
                         bar_name, line_name, chart_title):
-    num_cases_list = [round(case_factor*i) for i in true_cases_list]
-    lag_dates_list = [i+timedelta(10) for i in dates_list]
-    num_cases_arr = np.array(num_cases_list)
-    num_new_cases_arr = np.array(num_cases_list[1:]+[0]) - num_cases_arr
-    num_new_cases_arr = np.append(num_new_cases_arr[:-1], num_new_cases_arr[-1])
-    num_cases_arr[10:] = num_cases_arr[10:] - num_new_cases_arr[:-10]
-    bar_colors_list = ['#636efa' for _ in range(len(lag_dates_list))]
-    crossed_indicator = False
+    crossed_idx = first_crossing(num_cases_arr, num_capacity)
+    over_capacity = num_cases_arr > num_capacity
     date_crossed = "-"
-    for bar_idx in range(len(lag_dates_list)):
-        if num_cases_arr[bar_idx] > num_capacity:
-            bar_colors_list[bar_idx] = '#db1313'
-            if not crossed_indicator:
-                date_crossed = lag_dates_list[bar_idx]
-                crossed_indicator = True
-
-    fig = go.Figure()
-    fig.add_trace(
-        go.Bar(
-            x=lag_dates_list,
-            y=num_cases_arr,
-            name=bar_name,
-            marker_color=bar_colors_list
-        )
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=lag_dates_list,
-            y=[num_capacity for _ in range(len(dates_list))],
-            name=line_name
-        )
-    )
+    if crossed_idx >= 0:
+        date_crossed = lag_dates[crossed_idx].item()
+
     annotations = []
     annotations.append(dict(xref='paper', x=0.65, y=num_capacity,
                                   xanchor='right', yanchor='bottom',
@@ -166,37 +368,48 @@ def plot_barline_combo(case_factor, true_cases_list, dates_list, num_capacity,
                                   font=dict(family='Arial',
                                             size=12),
                                   showarrow=False))
-    fig.update_layout(title={
-                        'text': '<b>{}</b>'.format(chart_title),
-                        'y':0.9,
-                        'x':0.5,
-                        'xanchor': 'center',
-                        'yanchor': 'top',
-                        'font': {'size': 12}},
-                   yaxis_title={'text': bar_name, 'font': {'size': 12}},
-                   transition=dict(duration=1000),
-                   showlegend=False,
-                   annotations=annotations,
-                   margin=dict(l=50,r=30,b=50,t=90))
+    layout = dict(barline_layout,
+                  title=dict(barline_layout['title'],
+                             text='<b>{}</b>'.format(chart_title)),
+                  yaxis=dict(barline_layout['yaxis'],
+                             title=dict(barline_layout['yaxis']['title'],
+                                        text=bar_name)),
+                  annotations=annotations)
+    if settings.COMPACT_FIGURES:
+        # The capacity line is a single shape instead of a constant trace.
+        layout.update(
+            barmode='overlay',
+            xaxis=dict(layout.get('xaxis', {}), type='date'),
+            shapes=[dict(type='line', xref='paper', x0=0, x1=1,
+                         y0=num_capacity, y1=num_capacity,
+                         line={'color': capacity_line_color, 'width': 2})])
+        data = compact_bars(num_cases_arr, lag_dates, over_capacity,
+                            crossed_idx, bar_name)
+    else:
+        bar_colors_list = np.where(over_capacity, '#db1313', '#636efa')
+        data = [
+            {'type': 'bar', 'x': lag_dates, 'y': y_values(num_cases_arr),
+             'name': bar_name, 'marker': {'color': bar_colors_list}},
+            {'type': 'scatter', 'x': lag_dates,
+             'y': y_values(np.full(len(lag_dates), num_capacity)),
+             'name': line_name},
+        ]
+    fig = {'data': data, 'layout': layout}
     return fig, date_crossed
 
-@app.callback(
-    Output('datatable-div', 'children'),
-    [Input('submit-button', 'n_clicks')],
-    [State('total-deaths', 'value'),
-     State('fatality-rate', 'value'),
-     State('days-death', 'value'),
-     State('doubling-time', 'value')])
+@stage_metrics.timed('update_calc_table')
 def update_calc_table(n_clicks, total_deaths, fatality_rate,
                         days_death, doubling_time):
-    number_cases_causing_death, \
-    number_times_cases_doubled, \
-    true_cases_today = \
-        calc_metrics(total_deaths, fatality_rate, days_death, doubling_time)
-    likely_true_cases_tomorrow = round(true_cases_today * 2**(1 / number_times_cases_doubled))
-    likely_true_cases_ina_week = round(true_cases_today * 2**(7 / number_times_cases_doubled))
-    likely_new_cases_tomorrow = likely_true_cases_tomorrow - true_cases_today
-    likely_new_cases_ina_week = likely_true_cases_ina_week - true_cases_today
+    return cached_children('datatable-div', (total_deaths, fatality_rate, days_death,
+                                     doubling_time), build_calc_table)
+
+@stage_metrics.timed('build_calc_table')
+def build_calc_table(date_today, total_deaths, fatality_rate, days_death,
+                        doubling_time):
+    rows = calc_table_rows(
+        *cached_metrics(total_deaths, fatality_rate, days_death, doubling_time))
+    # Imported on first use, see FAST_STARTUP.
+    import dash_table
     return dash_table.DataTable(
                 id='table',
                 style_as_list_view=True,
@@ -214,7 +427,15 @@ def update_calc_table(n_clicks, total_deaths, fatality_rate,
                         },
                         'font-size': 16,
                     }],
-                data=[{'Calculated metric names': 'Number of cases that caused the deaths',
+                data=rows)
+
+def calc_table_rows(number_cases_causing_death, number_times_cases_doubled,
+                        true_cases_today):
+    likely_true_cases_tomorrow = round(true_cases_today * 2**(1 / number_times_cases_doubled))
+    likely_true_cases_ina_week = round(true_cases_today * 2**(7 / number_times_cases_doubled))
+    likely_new_cases_tomorrow = likely_true_cases_tomorrow - true_cases_today
+    likely_new_cases_ina_week = likely_true_cases_ina_week - true_cases_today
+    return [{'Calculated metric names': 'Number of cases that caused the deaths',
                         'Calculated metric values': number_cases_causing_death},
                         {'Calculated metric names': 'Number of times cases have doubled',
                                 'Calculated metric values': number_times_cases_doubled},
@@ -227,93 +448,330 @@ def update_calc_table(n_clicks, total_deaths, fatality_rate,
                         {'Calculated metric names': 'Likely new cases tomorrow',
                                 'Calculated metric values': likely_new_cases_tomorrow},
                         {'Calculated metric names': 'Likely new cases in a week',
-                                'Calculated metric values': likely_new_cases_ina_week}])
-
-@app.callback(
-    Output('barcharts-div', 'children'),
-    [Input('submit-button', 'n_clicks')],
-    [State('total-deaths', 'value'),
-     State('fatality-rate', 'value'),
-     State('days-death', 'value'),
-     State('doubling-time', 'value'),
-     State('num-beds', 'value'),
-     State('num-icus', 'value'),
-     State('num-ventilators', 'value'),
-     State('sim-days', 'value'),
-     State('pct-hospitalization', 'value'),
-     State('pct-icu', 'value'),
-     State('pct-ventilator', 'value')])
+                                'Calculated metric values': likely_new_cases_ina_week}]
+
+@stage_metrics.timed('update_bar_charts')
 def update_bar_charts(n_clicks, total_deaths, fatality_rate, days_death, doubling_time,
                         num_beds, num_icus, num_ventilators, sim_days,
-                        pct_hospitalization, pct_icu, pct_ventilator):
-    number_cases_causing_death, \
-    number_times_cases_doubled, \
-    true_cases_today = \
-        calc_metrics(total_deaths, fatality_rate, days_death, doubling_time)
-    date_today = dt.now().date()
-    dates_list = [date_today]
-    true_cases_list = [true_cases_today]
-
-    for day_num in range(1, sim_days+1):
-        true_cases_list.append(round(true_cases_today * 2**(day_num / number_times_cases_doubled)))
-        dates_list.append(date_today+timedelta(day_num))
-
-    fig1 = go.Figure()
-    fig1.add_trace(
-        go.Scatter(
-            x=dates_list,
-            y=true_cases_list,
-            line=dict(width=2),
-            mode='lines+markers'
-        )
-    )
-    fig1.update_layout(title={
-                        'text': '<b>Estimation of true number of cases over time</b>',
-                        'y':0.9,
-                        'x':0.5,
-                        'xanchor': 'center',
-                        'yanchor': 'top',
-                        'font': {'size': 12}},
-                   yaxis_title={'text': 'Estimated true number of cases', 'font': {'size': 12}},
-                   transition={'duration': 1000},
-                   margin=dict(l=50,r=30,b=50,t=90))
+                        pct_hospitalization, pct_icu, pct_ventilator,
+                        uncertainty_pct=0, model='doubling', spreads=''):
+    try:
+        spreads = format_spreads(spreads)
+    except ValueError as e:
+        return busy_notice(str(e))
+    cost = simulation_cost(sim_days, uncertain(uncertainty_pct, spreads), model)
+    try:
+        return cached_children('barcharts-div', (total_deaths, fatality_rate, days_death,
+                                          doubling_time, num_beds, num_icus,
+                                          num_ventilators, sim_days,
+                                          pct_hospitalization, pct_icu,
+                                          pct_ventilator, uncertainty_pct or 0,
+                                          model or 'doubling', spreads),
+                               build_bar_charts,
+                               offload=simulation_executor.offloads(cost))
+    except ExecutorBusy:
+        return busy_notice('The server is busy with other simulations. '
+                           'Please try again in a moment.')
+    except ExecutorTimeout:
+        return busy_notice('The simulation took too long. Try a shorter '
+                           'horizon or less uncertainty.')
+
+def uncertain(uncertainty_pct, spreads=''):
+    # Whether any input is sampled, i.e. a Monte Carlo run.
+    return any(input_spreads(uncertainty_pct, spreads).values())
+
+def simulation_cost(sim_days, sampled, model):
+    # Rough work estimate: one projection per sample and day. A compartmental
+    # model day is at least steps_per_day solver steps of about 100 projection days.
+    cost = (sim_days or 0) * (settings.MONTE_CARLO_SAMPLES if sampled else 1)
+    if model == 'seir':
+        cost *= 100 * settings.SEIR_STEPS_PER_DAY
+    return cost
+
+def busy_notice(message):
+    return [html.Div(message, id='busy-notice', className='row',
+                     style={'color':'red', 'font-size':16, 'margin-top':30,
+                            'text-align':'center'})]
+
+# Per resource: series name, figure id, shortage date id, bar name, line name
+# and the wording used in the chart title.
+RESOURCE_CHARTS = (
+    ('hospitalizations', 'hospitalizations-estimate', 'bed-shortage-date',
+     'Estimated number of hospitalizations needed', 'Hospital beds capacity',
+     'hospitalization', 'hospitalization'),
+    ('icus', 'icus-estimate', 'icu-shortage-date',
+     'Estimated number of ICUs needed', 'ICU capacity', 'ICUs', 'ICU'),
+    ('ventilators', 'ventilators-estimate', 'ventilator-shortage-date',
+     'Estimated number of ventilators needed', 'Ventilators capacity',
+     'ventilators', 'ventilators'),
+)
+RESOURCE_INPUTS = {
+    'hospitalizations': ('pct_hospitalization', 'num_beds'),
+    'icus': ('pct_icu', 'num_icus'),
+    'ventilators': ('pct_ventilator', 'num_ventilators'),
+}
+# Compartmental model parameters that have no input on the page.
+SEIR_OPTIONS = dict(population=settings.SEIR_POPULATION,
+                    incubation_days=settings.SEIR_INCUBATION_DAYS,
+                    infectious_days=settings.SEIR_INFECTIOUS_DAYS,
+                    stay_days=(settings.SEIR_BED_STAY_DAYS,
+                               settings.SEIR_ICU_STAY_DAYS,
+                               settings.SEIR_VENTILATOR_STAY_DAYS),
+                    steps_per_day=settings.SEIR_STEPS_PER_DAY)
+SEIR_STAY_DAYS = dict(zip(RESOURCE_INPUTS, SEIR_OPTIONS['stay_days']))
+# Doubling model stay kernels per series name.
+STAY_KERNELS = dict(zip(RESOURCE_INPUTS,
+                        [stay_kernel(settings.BED_STAY_KERNEL),
+                         stay_kernel(settings.ICU_STAY_KERNEL),
+                         stay_kernel(settings.VENTILATOR_STAY_KERNEL)]))
+# The same kernels as [day, weight] pairs for assets/simulation.js.
+STAY_KERNEL_TAPS = {name: [[day, float(weight)] for day, weight in kernel_taps(kernel)]
+                    for name, kernel in STAY_KERNELS.items()}
+
+@stage_metrics.timed('simulate')
+def simulate(date_today, total_deaths, fatality_rate, days_death, doubling_time,
+                num_beds, num_icus, num_ventilators, sim_days,
+                pct_hospitalization, pct_icu, pct_ventilator, uncertainty_pct=0,
+                model='doubling', spreads='', use_cache=True):
+    # The series behind the four charts. With uncertainty_pct the rates are
+    # drawn from triangular distributions +/- uncertainty_pct around the
+    # inputs, or +/- their own percent in spreads (see
+    # montecarlo.parse_spreads); the series are the medians and
+    # bands/shortage hold the spread.
+    # model 'seir' runs the compartmental model from the same true cases;
+    # saturated is the share of runs that reached its population.
+    # use_cache=False leaves the result cache alone, for batch callers.
+    dates, lag_dates = date_axes(date_today, sim_days)
+    result = {'dates': dates, 'lag_dates': lag_dates, 'sim_days': sim_days,
+              'bands': None, 'shortage': None, 'saturated': 0.0}
+    if not uncertain(uncertainty_pct, spreads):
+        number_cases_causing_death, \
+        number_times_cases_doubled, \
+        true_cases_today = \
+            (cached_metrics if use_cache else calc_metrics)(
+                total_deaths, fatality_rate, days_death, doubling_time)
+        if model == 'seir':
+            # Calibrated to the doubling model, whose cases double every
+            # number_times_cases_doubled days, so the two differ in structure
+            # rather than in their starting growth rate.
+            result['series'] = project_seir(true_cases_today,
+                                            number_times_cases_doubled,
+                                            sim_days, pct_hospitalization,
+                                            pct_icu, pct_ventilator,
+                                            kernels=STAY_KERNELS,
+                                            **SEIR_OPTIONS)
+            result['saturated'] = float(saturated(
+                true_cases_today, SEIR_OPTIONS['population']))
+        else:
+            result['series'] = project(true_cases_today, number_times_cases_doubled,
+                                       sim_days, pct_hospitalization, pct_icu,
+                                       pct_ventilator, kernels=STAY_KERNELS)
+        return result
+
+    distributions = relative_spread(dict(fatality_rate=fatality_rate,
+                                         days_death=days_death,
+                                         doubling_time=doubling_time,
+                                         pct_hospitalization=pct_hospitalization,
+                                         pct_icu=pct_icu,
+                                         pct_ventilator=pct_ventilator),
+                                    input_spreads(uncertainty_pct, spreads))
+    capacities = dict(num_beds=num_beds, num_icus=num_icus,
+                      num_ventilators=num_ventilators)
+    monte_carlo = run_monte_carlo(total_deaths, distributions, capacities,
+                                  sim_days,
+                                  num_samples=settings.MONTE_CARLO_SAMPLES,
+                                  seed=settings.MONTE_CARLO_SEED,
+                                  seir_options=SEIR_OPTIONS if model == 'seir' else None,
+                                  kernels=STAY_KERNELS)
+    result['bands'] = monte_carlo['bands']
+    result['shortage'] = monte_carlo['shortage']
+    result['saturated'] = monte_carlo['saturated']
+    result['series'] = {name: as_counts(np.round(bands[50]))
+                        for name, bands in monte_carlo['bands'].items()}
+    return result
+
+def cached_simulation(date_today, total_deaths, fatality_rate, days_death,
+                        doubling_time, num_beds, num_icus, num_ventilators,
+                        sim_days, pct_hospitalization, pct_icu, pct_ventilator,
+                        uncertainty_pct=0, model='doubling', spreads='',
+                        offload=False):
+    # Capacities only enter the Monte Carlo shortage statistics, so without
+    # uncertainty one entry serves every capacity. With offload the series
+    # are computed in simulation_executor's pool.
+    inputs = [total_deaths, fatality_rate, days_death, doubling_time, sim_days,
+              pct_hospitalization, pct_icu, pct_ventilator, uncertainty_pct, model,
+              spreads]
+    if uncertain(uncertainty_pct, spreads):
+        inputs += [num_beds, num_icus, num_ventilators]
+    key = ('simulation', date_today.isoformat()) + normalize_inputs(inputs)
+    args = (date_today, total_deaths, fatality_rate, days_death, doubling_time,
+            num_beds, num_icus, num_ventilators, sim_days, pct_hospitalization,
+            pct_icu, pct_ventilator, uncertainty_pct, model, spreads)
+
+    def compute():
+        if offload:
+            with stage_metrics.timer('offload_simulation'):
+                return simulation_executor.run(simulate, *args)
+        return simulate(*args)
+
+    return simulation_cache.get_or_compute(key, compute)
+
+def totals_figure(result):
+    fig = plot_totals(result['dates'], result['series']['total'])
+    if result['bands']:
+        fig['data'] = band_traces(result['dates'], result['bands']['total'],
+                                  '99,110,250') + fig['data']
+    return fig
+
+def spread_label(uncertainty_pct, spreads=''):
+    # 'rates ±10%, doubling_time ±40%' for the chart titles.
+    labels = ['rates ±{}%'.format(uncertainty_pct)] if uncertainty_pct else []
+    labels += ['{} ±{:g}%'.format(name, pct)
+               for name, pct in sorted(parse_spreads(spreads).items())]
+    return ', '.join(labels)
+
+def resource_figure(result, name, num_capacity, pct, uncertainty_pct=0,
+                    model='doubling', spreads=''):
+    # Returns the figure, the shortage date and, with uncertainty, the line
+    # describing the spread of shortage dates.
+    _, _, _, bar_name, line_name, subject, need = \
+        next(chart for chart in RESOURCE_CHARTS if chart[0] == name)
+    sampled = result['bands'] is not None
+    if sampled and model == 'seir':
+        chart_title = 'Estimation of number of cases requiring {}<br>(SEIR model, median of {} samples, {},<br>shaded 50% and 90% ranges)'.format(
+            subject, settings.MONTE_CARLO_SAMPLES,
+            spread_label(uncertainty_pct, spreads))
+    elif model == 'seir':
+        chart_title = 'Estimation of number of cases requiring {}<br>(SEIR model, {}% require {} 10 days<br>after infection for {:g} days on average)'.format(
+            subject, pct, need, SEIR_STAY_DAYS[name])
+    elif sampled:
+        chart_title = 'Estimation of number of cases requiring {}<br>(median of {} samples, {},<br>shaded 50% and 90% ranges)'.format(
+            subject, settings.MONTE_CARLO_SAMPLES,
+            spread_label(uncertainty_pct, spreads))
+    else:
+        chart_title = 'Estimation of number of cases requiring {}<br>(assuming on average {}% require {}<br>10 days after infection)'.format(
+            subject, pct, need)
+    if model == 'seir' and result.get('saturated'):
+        # seir.project_seir ran these on the doubling model; the title says so
+        # rather than the page showing an empty model without shortages.
+        chart_title = chart_title[:-1] + ';<br>{} the population of {:,.0f}, doubling model shown)'.format(
+            '{:.0%} of samples reach'.format(result['saturated'])
+            if sampled else 'true cases today reach',
+            SEIR_OPTIONS['population'])
+    fig, date_crossed = plot_barline_combo(result['series'][name],
+                                           result['lag_dates'], num_capacity,
+                                           bar_name, line_name, chart_title)
+    if not sampled:
+        return fig, date_crossed, None
+    fig['data'] = fig['data'] + band_traces(result['lag_dates'],
+                                            result['bands'][name], '0,0,0')
+    add_shortage_chance(fig, result['shortage'][name], result['lag_dates'])
+    date_crossed, detail = shortage_summary(result['shortage'][name],
+                                            result['lag_dates'],
+                                            result['sim_days'])
+    return fig, date_crossed, detail
+
+@stage_metrics.timed('build_bar_charts')
+def build_bar_charts(date_today, total_deaths, fatality_rate, days_death, doubling_time,
+                        num_beds, num_icus, num_ventilators, sim_days,
+                        pct_hospitalization, pct_icu, pct_ventilator,
+                        uncertainty_pct=0, model='doubling', spreads=''):
+    result = cached_simulation(date_today, total_deaths, fatality_rate,
+                               days_death, doubling_time, num_beds, num_icus,
+                               num_ventilators, sim_days, pct_hospitalization,
+                               pct_icu, pct_ventilator, uncertainty_pct, model,
+                               spreads)
+    figures, dates_crossed, details = bar_chart_figures(
+        result, num_beds, num_icus, num_ventilators, pct_hospitalization,
+        pct_icu, pct_ventilator, uncertainty_pct, model, spreads)
+    return chart_panels(*figures, *dates_crossed, details=details)
+
+def bar_chart_figures(result, num_beds, num_icus, num_ventilators,
+                        pct_hospitalization, pct_icu, pct_ventilator,
+                        uncertainty_pct=0, model='doubling', spreads=''):
+    # The four figures for a simulate() result, the three shortage dates and,
+    # with uncertainty, the lines describing their spread.
+    fig1 = totals_figure(result)
+    fig2, date_crossed2, detail2 = resource_figure(
+        result, 'hospitalizations', num_beds, pct_hospitalization, uncertainty_pct,
+        model, spreads)
+    fig3, date_crossed3, detail3 = resource_figure(
+        result, 'icus', num_icus, pct_icu, uncertainty_pct, model, spreads)
+    fig4, date_crossed4, detail4 = resource_figure(
+        result, 'ventilators', num_ventilators, pct_ventilator, uncertainty_pct,
+        model, spreads)
+    return ([fig1, fig2, fig3, fig4],
+            [date_crossed2, date_crossed3, date_crossed4],
+            [detail2, detail3, detail4] if result['shortage'] else None)
 
-    fig2, date_crossed2 = plot_barline_combo(pct_hospitalization/100, true_cases_list, dates_list, num_beds,
-                            'Estimated number of hospitalizations needed',
-                            'Hospital beds capacity',
-                            'Estimation of number of cases requiring hospitalization<br>(assuming on average {}% require hospitalization<br>10 days after infection)'.format(pct_hospitalization))
+def add_shortage_chance(fig, shortage, lag_dates):
+    # The distribution of shortage dates as the share of samples short of
+    # capacity by each day, on a percent axis on the right.
+    chance = np.round(100 * np.cumsum(shortage['distribution']), 1)
+    fig['data'] = fig['data'] + [dict(
+        x_values(lag_dates), type='scatter', y=y_values(chance), yaxis='y2',
+        mode='lines', line={'color': capacity_line_color, 'width': 2,
+                            'dash': 'dot'},
+        name='Chance of shortage by this day', hovertemplate='%{y}%')]
+    fig['layout'] = dict(fig['layout'],
+                         margin=dict(fig['layout']['margin'], r=60),
+                         yaxis2={'overlaying': 'y', 'side': 'right',
+                                 'range': [0, 100], 'ticksuffix': '%',
+                                 'showgrid': False, 'zeroline': False,
+                                 'title': {'text': 'Chance of shortage by this day',
+                                           'font': {'size': 12}}})
 
-    fig3, date_crossed3 = plot_barline_combo(pct_icu/100, true_cases_list, dates_list, num_icus,
-                            'Estimated number of ICUs needed',
-                            'ICU capacity',
-                            'Estimation of number of cases requiring ICUs<br>(assuming on average {}% require ICU<br>10 days after infection)'.format(pct_icu))
+def band_traces(dates, bands, color):
+    # Two filled areas per chart, 5th-95th and 25th-75th percentile; each
+    # upper edge is followed by the lower edge that fills to it.
+    traces = []
+    for low, high, opacity in ((5, 95, 0.15), (25, 75, 0.3)):
+        for pct, fill in ((high, 'none'), (low, 'tonexty')):
+            traces.append(dict(x_values(dates), type='scatter',
+                               y=y_values(bands[pct]), mode='lines',
+                               line={'width': 0}, fill=fill,
+                               fillcolor='rgba({},{})'.format(color, opacity),
+                               name='{}-{}th percentile'.format(low, high),
+                               hoverinfo='skip', showlegend=False))
+    return traces
 
-    fig4, date_crossed4 = plot_barline_combo(pct_ventilator/100, true_cases_list, dates_list, num_ventilators,
-                            'Estimated number of ventilators needed',
-                            'Ventilators capacity',
-                            'Estimation of number of cases requiring ventilators<br>(assuming on average {}% require ventilators<br>10 days after infection)'.format(pct_ventilator))
+def shortage_summary(shortage, lag_dates, sim_days):
+    # Median shortage date for the headline and the spread for the line below.
+    first_day = shortage['first_day']
+    days = [shortage_day_percentile(first_day, q) for q in (50, 5, 95)]
+    median, early, late = [lag_dates[d].item() if d >= 0 else None
+                           for d in days]
+    detail = '{:.0%} chance within {} days'.format(shortage['probability'],
+                                                   sim_days)
+    if early and late:
+        detail += '; 90% between {} and {}'.format(early, late)
+    elif early:
+        detail += '; 5% chance by {}'.format(early)
+    return median or '-', detail
 
+def chart_panels(fig1, fig2, fig3, fig4,
+                    date_crossed2, date_crossed3, date_crossed4, details=None):
     html_div_children = [
         html.Div([
             html.Div([
                 html.Div('Hospital bed shortage likely on:',
                     className='row', style=dict(fontWeight='bold',
                             textAlign='left', marginLeft='5%', fontSize=14)),
-                html.Div(str(date_crossed2), className='row',
+                html.Div(str(date_crossed2), id='bed-shortage-date', className='row',
                     style={'color':'red', 'font-size':24, 'text-align':'left', 'margin-left':'5%'}),
             ], className='four columns'),
             html.Div([
                 html.Div('ICU shortage likely on:',
                     className='row', style=dict(fontWeight='bold',
                             textAlign='center', fontSize=14)),
-                html.Div(str(date_crossed3), className='row',
+                html.Div(str(date_crossed3), id='icu-shortage-date', className='row',
                     style={'color':'red', 'font-size':24, 'text-align':'center'}),
             ], className='four columns'),
             html.Div([
                 html.Div('Ventilator shortage likely on:',
                     className='row', style=dict(fontWeight='bold',
                             textAlign='right', marginRight='7%', fontSize=14)),
-                html.Div(str(date_crossed4), className='row',
+                html.Div(str(date_crossed4), id='ventilator-shortage-date', className='row',
                     style={'color':'red', 'font-size':24, 'text-align':'right', 'margin-right':'7%'}),
             ], className='four columns'),
         ], className='row'),
@@ -338,7 +796,334 @@ def update_bar_charts(n_clicks, total_deaths, fatality_rate, days_death, doublin
             ], className='six columns'),
         ], className='row'),
     ]
+    if details:
+        # Shortage spread under each date in Monte Carlo mode.
+        aligns = ({'text-align':'left', 'margin-left':'5%'},
+                  {'text-align':'center'},
+                  {'text-align':'right', 'margin-right':'7%'})
+        for column, detail, align in zip(html_div_children[0].children,
+                                         details, aligns):
+            date_div = column.children[1]
+            column.children.append(html.Div(detail,
+                id=date_div.id.replace('-date', '-detail'), className='row',
+                style=dict(align, **{'color':'#555', 'font-size':12})))
     return html_div_children
 
+def update_simulation(n_clicks, total_deaths, fatality_rate, days_death, doubling_time,
+                        num_beds, num_icus, num_ventilators, sim_days,
+                        pct_hospitalization, pct_icu, pct_ventilator,
+                        uncertainty_pct=0, model='doubling', spreads=''):
+    # Both outputs in one request; calc_metrics runs once and the second
+    # lookup is served from simulation_cache.
+    return (update_calc_table(n_clicks, total_deaths, fatality_rate,
+                              days_death, doubling_time),
+            update_bar_charts(n_clicks, total_deaths, fatality_rate,
+                              days_death, doubling_time, num_beds, num_icus,
+                              num_ventilators, sim_days, pct_hospitalization,
+                              pct_icu, pct_ventilator, uncertainty_pct, model,
+                              spreads))
+
+SIMULATION_INPUTS = ('total_deaths', 'fatality_rate', 'days_death',
+                     'doubling_time', 'num_beds', 'num_icus', 'num_ventilators',
+                     'sim_days', 'pct_hospitalization', 'pct_icu',
+                     'pct_ventilator', 'uncertainty_pct', 'model', 'spreads')
+
+def simulation_state(date_today, values):
+    # What update_incremental remembers in the browser about the last run.
+    state = dict(zip(SIMULATION_INPUTS, normalize_inputs(values)))
+    state['date'] = date_today.isoformat()
+    return state
+
+def stale_outputs(previous, current):
+    # Names of the outputs whose inputs differ between two simulation states:
+    # 'table', 'total' and the RESOURCE_CHARTS series names.
+    if previous is None:
+        return {'table', 'total'} | {chart[0] for chart in RESOURCE_CHARTS}
+    changed = {name for name, value in current.items()
+               if previous.get(name) != value}
+    table_inputs = {'date', 'total_deaths', 'fatality_rate', 'days_death',
+                    'doubling_time'}
+    curve_inputs = table_inputs | {'sim_days', 'uncertainty_pct', 'model',
+                                   'spreads'}
+    stale = set()
+    if changed & table_inputs:
+        stale.add('table')
+    if changed & curve_inputs:
+        stale.add('total')
+    for name, inputs in RESOURCE_INPUTS.items():
+        if changed & (curve_inputs | set(inputs)):
+            stale.add(name)
+    return stale
+
+def observed_output(output_id, value):
+    # Records an output's serialization time and size like cached_children,
+    # for outputs that are built without it. Dash serializes the value again.
+    if stage_metrics.enabled:
+        with stage_metrics.timer('serialize_' + output_id):
+            payload = json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder)
+        stage_metrics.observe_bytes(output_id, len(payload))
+    return value
+
+@stage_metrics.timed('update_incremental')
+def update_incremental(n_clicks, total_deaths, fatality_rate, days_death, doubling_time,
+                        num_beds, num_icus, num_ventilators, sim_days,
+                        pct_hospitalization, pct_icu, pct_ventilator,
+                        uncertainty_pct, model, spreads, previous,
+                        is_current=None):
+    # Sends only the outputs whose inputs changed since the last run; a
+    # capacity change redraws one chart from the cached series. is_current
+    # lets live mode drop a run that a newer request has overtaken.
+    date_today = dt.now().date()
+    # Table, totals figure, then figure, date and detail per resource chart,
+    # then the status line and the new state.
+    outputs = [dash.no_update] * (2 + 3*len(RESOURCE_CHARTS)) + ['', previous]
+    try:
+        spreads = format_spreads(spreads)
+    except ValueError as e:
+        outputs[-2] = str(e)
+        return outputs
+    values = (total_deaths, fatality_rate, days_death, doubling_time, num_beds,
+              num_icus, num_ventilators, sim_days, pct_hospitalization,
+              pct_icu, pct_ventilator, uncertainty_pct or 0, model or 'doubling',
+              spreads)
+    current = simulation_state(date_today, values)
+    stale = stale_outputs(previous, current)
+    outputs[-1] = current
+    if 'table' in stale:
+        outputs[0] = update_calc_table(n_clicks, total_deaths, fatality_rate,
+                                       days_death, doubling_time)
+    if not stale - {'table'}:
+        return outputs
+
+    cost = simulation_cost(sim_days, uncertain(uncertainty_pct, spreads), model)
+    try:
+        result = cached_simulation(date_today, *values,
+                                   offload=simulation_executor.offloads(cost))
+    except (ExecutorBusy, ExecutorTimeout) as e:
+        # Keep the previous charts and let the next click retry everything.
+        outputs[-2] = ('The server is busy with other simulations. Please try again in a moment.'
+                       if isinstance(e, ExecutorBusy) else
+                       'The simulation took too long. Try a shorter horizon or less uncertainty.')
+        outputs[-1] = None
+        return outputs
+    if is_current is not None and not is_current():
+        raise PreventUpdate
+
+    if 'total' in stale:
+        outputs[1] = observed_output('totals-estimate', totals_figure(result))
+    inputs = dict(zip(SIMULATION_INPUTS, values))
+    for idx, chart in enumerate(RESOURCE_CHARTS):
+        name = chart[0]
+        if name in stale:
+            pct, capacity = RESOURCE_INPUTS[name]
+            fig, date_crossed, detail = resource_figure(
+                result, name, inputs[capacity], inputs[pct], uncertainty_pct,
+                inputs['model'], spreads)
+            outputs[2+idx] = observed_output(chart[1], fig)
+            outputs[2+len(RESOURCE_CHARTS)+idx] = str(date_crossed)
+            outputs[2+2*len(RESOURCE_CHARTS)+idx] = detail or ''
+    return outputs
+
+SESSION_COOKIE = 'simulation_session'
+
+@server.after_request
+def set_session_cookie(response):
+    # Live mode coalesces requests per browser session.
+    if settings.LIVE_UPDATES and SESSION_COOKIE not in request.cookies:
+        response.set_cookie(SESSION_COOKIE, secrets.token_hex(8),
+                            httponly=True, samesite='Lax')
+    return response
+
+def update_live(n_clicks, total_deaths, fatality_rate, days_death, doubling_time,
+                    num_beds, num_icus, num_ventilators, sim_days,
+                    pct_hospitalization, pct_icu, pct_ventilator,
+                    uncertainty_pct, model, spreads, previous):
+    # Every edit fires this in live mode. Boxes that are empty or out of
+    # range mid-edit are skipped, as is a spread spec still being typed; a
+    # burst of edits from one session runs only its last request, and a run
+    # overtaken by a newer one stops early.
+    if None in (total_deaths, fatality_rate, days_death, doubling_time,
+                num_beds, num_icus, num_ventilators, sim_days,
+                pct_hospitalization, pct_icu, pct_ventilator):
+        raise PreventUpdate
+    try:
+        parse_spreads(spreads)
+    except ValueError:
+        raise PreventUpdate
+    session = request.cookies.get(SESSION_COOKIE, request.remote_addr)
+    ticket = live_requests.begin(session)
+    try:
+        if not live_requests.settle(session, ticket):
+            raise PreventUpdate
+        return update_incremental(
+            n_clicks, total_deaths, fatality_rate, days_death, doubling_time,
+            num_beds, num_icus, num_ventilators, sim_days, pct_hospitalization,
+            pct_icu, pct_ventilator, uncertainty_pct, model, spreads, previous,
+            is_current=lambda: live_requests.is_current(session, ticket))
+    finally:
+        live_requests.finish(session, ticket)
+
+calc_table_states = [State('total-deaths', 'value'),
+                     State('fatality-rate', 'value'),
+                     State('days-death', 'value'),
+                     State('doubling-time', 'value')]
+bar_charts_states = calc_table_states + [State('num-beds', 'value'),
+                                         State('num-icus', 'value'),
+                                         State('num-ventilators', 'value'),
+                                         State('sim-days', 'value'),
+                                         State('pct-hospitalization', 'value'),
+                                         State('pct-icu', 'value'),
+                                         State('pct-ventilator', 'value')]
+# Kept out of bar_charts_states, which also defines the clientside inputs.
+server_states = [State('uncertainty-pct', 'value'), State('model', 'value'),
+                 State('input-spreads', 'value')]
+
+def incremental_dependencies():
+    # In live mode every input box drives the callback, not only the button.
+    states = bar_charts_states + server_states
+    if settings.LIVE_UPDATES:
+        return ([Input('submit-button', 'n_clicks')] +
+                [Input(state.component_id, state.component_property)
+                 for state in states],
+                [State('simulation-inputs', 'data')])
+    return ([Input('submit-button', 'n_clicks')],
+            states + [State('simulation-inputs', 'data')])
+
+if settings.CLIENTSIDE_SIMULATION:
+    # The charts are computed in the browser by assets/simulation.js and
+    # follow the inputs as they change; only the table goes to the server.
+    # assets/simulation.js implements the doubling model only, with the stay
+    # kernels passed in the stay-kernels store, and draws no samples.
+    app.layout['model'].options = app.layout['model'].options[:1]
+    app.layout['model'].value = 'doubling'
+    app.layout['uncertainty-controls'].style = {'display': 'none'}
+    app.layout['barcharts-div'].children = chart_panels({}, {}, {}, {},
+                                                        '-', '-', '-') + [
+        dcc.Store(id='figure-template',
+                  data=totals_layout['template']),
+        dcc.Store(id='stay-kernels', data=STAY_KERNEL_TAPS)]
+    app.callback(
+        Output('datatable-div', 'children'),
+        [Input('submit-button', 'n_clicks')],
+        calc_table_states)(update_calc_table)
+    app.clientside_callback(
+        ClientsideFunction(namespace='simulation', function_name='update_charts'),
+        [Output('totals-estimate', 'figure'),
+         Output('hospitalizations-estimate', 'figure'),
+         Output('icus-estimate', 'figure'),
+         Output('ventilators-estimate', 'figure'),
+         Output('bed-shortage-date', 'children'),
+         Output('icu-shortage-date', 'children'),
+         Output('ventilator-shortage-date', 'children')],
+        [Input('submit-button', 'n_clicks')] +
+        [Input(state.component_id, state.component_property)
+         for state in bar_charts_states],
+        [State('figure-template', 'data'), State('stay-kernels', 'data')])
+elif settings.INCREMENTAL_UPDATES:
+    # The chart components stay in the page and each output is updated on
+    # its own; simulation-inputs holds the inputs of the last run.
+    app.layout['barcharts-div'].children = [
+        html.Div(id='simulation-status', className='row',
+                 style={'color':'red', 'font-size':16, 'text-align':'center'}),
+        dcc.Store(id='simulation-inputs')] + chart_panels(
+            {}, {}, {}, {}, '-', '-', '-', details=['', '', ''])
+    app.callback(
+        [Output('datatable-div', 'children'),
+         Output('totals-estimate', 'figure')] +
+        [Output(chart[1], 'figure') for chart in RESOURCE_CHARTS] +
+        [Output(chart[2], 'children') for chart in RESOURCE_CHARTS] +
+        [Output(chart[2].replace('-date', '-detail'), 'children')
+         for chart in RESOURCE_CHARTS] +
+        [Output('simulation-status', 'children'),
+         Output('simulation-inputs', 'data')],
+        *incremental_dependencies())(
+            update_live if settings.LIVE_UPDATES else update_incremental)
+elif settings.COMBINED_CALLBACK:
+    app.callback(
+        [Output('datatable-div', 'children'),
+         Output('barcharts-div', 'children')],
+        [Input('submit-button', 'n_clicks')],
+        bar_charts_states + server_states)(update_simulation)
+else:
+    app.callback(
+        Output('datatable-div', 'children'),
+        [Input('submit-button', 'n_clicks')],
+        calc_table_states)(update_calc_table)
+    app.callback(
+        Output('barcharts-div', 'children'),
+        [Input('submit-button', 'n_clicks')],
+        bar_charts_states + server_states)(update_bar_charts)
+
+@server.route('/export/<fmt>', methods=['GET', 'POST'])
+def export(fmt):
+    # GET exports one scenario from query parameters named like the sweep
+    # inputs (total_deaths=10&doubling_time=4); POST takes
+    # {"sim_days": ..., "scenarios": [{...}, ...]}. Missing parameters take
+    # the dashboard defaults. Rows are written as they are computed.
+    # Imported here: sweep pulls in pandas, which the dashboard does not need.
+    from export import EXPORT_FORMATS, scenario_inputs
+    from sweep import DEFAULT_SIM_DAYS
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'Unknown format: {}'.format(fmt)}), 404
+    try:
+        if request.method == 'POST':
+            body = request.get_json(force=True)
+            scenarios = body.get('scenarios', [{}])
+            sim_days = int(body.get('sim_days', DEFAULT_SIM_DAYS))
+        else:
+            params = request.args.to_dict()
+            sim_days = int(params.pop('sim_days', DEFAULT_SIM_DAYS))
+            scenarios = [{name: float(value) for name, value in params.items()}]
+        scenario_inputs(scenarios)
+    except (AttributeError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e) or 'Invalid export request'}), 400
+    if not 0 <= sim_days <= settings.EXPORT_MAX_DAYS:
+        return jsonify({'error': 'sim_days must be between 0 and {}'.format(
+            settings.EXPORT_MAX_DAYS)}), 400
+    if not 1 <= len(scenarios) <= settings.EXPORT_MAX_SCENARIOS:
+        return jsonify({'error': 'Between 1 and {} scenarios are allowed'.format(
+            settings.EXPORT_MAX_SCENARIOS)}), 400
+    generate, mimetype = EXPORT_FORMATS[fmt]
+    return Response(stream_with_context(
+                        generate(scenarios, sim_days, dt.now().date(),
+                                 kernels=STAY_KERNELS)),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition':
+                             'attachment; filename=simulation.{}'.format(fmt)})
+
+@server.route('/cache-stats')
+def cache_stats():
+    return jsonify(simulation_cache.stats())
+
+@server.route('/metrics')
+def metrics():
+    cache = simulation_cache.stats()
+    shared = cache.get('shared', {})
+    executor = simulation_executor.stats()
+    live = live_requests.stats()
+    return Response(
+        stage_metrics.render(
+            counters={'simulation_cache_hits_total': cache['hits'],
+                      'simulation_cache_misses_total': cache['misses'],
+                      'simulation_cache_evictions_total': cache['evictions'],
+                      'simulation_shared_cache_hits_total': shared.get('hits', 0),
+                      'simulation_shared_cache_misses_total': shared.get('misses', 0),
+                      'simulation_executor_submitted_total': executor['submitted'],
+                      'simulation_executor_rejected_total': executor['rejected'],
+                      'simulation_executor_timeouts_total': executor['timeouts'],
+                      'simulation_live_requests_total': live['started'],
+                      'simulation_live_superseded_total': live['superseded']},
+            gauges={'simulation_cache_entries': cache['entries'],
+                    'simulation_cache_bytes': cache['bytes'],
+                    'simulation_shared_cache_entries': shared.get('entries', 0),
+                    'simulation_shared_cache_bytes': shared.get('bytes', 0),
+                    'simulation_executor_in_flight': executor['in_flight']}),
+        mimetype='text/plain; version=0.0.4')
+
+# Pool workers are forked from this process, so they are started only once
+# everything above is defined.
+if multiprocessing.current_process().name == 'MainProcess':
+    simulation_executor.warm()
+
 if __name__ == '__main__':
     app.run_server(debug=False)
@@ -0,0 +1,108 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                 16777216)
+
+
+class Histogram:
+    # Cumulative-bucket histogram in the Prometheus sense; observe() is a
+    # bisect and three additions under a lock.
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+
+class Registry:
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, label, value, buckets):
+        key = (name, label, value)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key,
+                                                        Histogram(buckets))
+        return histogram
+
+    def observe_latency(self, stage, seconds):
+        if self.enabled:
+            self.histogram('simulation_stage_seconds', 'stage', stage,
+                           LATENCY_BUCKETS).observe(seconds)
+
+    def observe_bytes(self, output, num_bytes):
+        if self.enabled:
+            self.histogram('simulation_payload_bytes', 'output', output,
+                           BYTES_BUCKETS).observe(num_bytes)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_latency(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self, counters=None, gauges=None):
+        # Prometheus text exposition format.
+        lines = []
+        by_name = {}
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for (name, label, value), histogram in histograms:
+            by_name.setdefault(name, []).append((label, value, histogram))
+        for name, series in by_name.items():
+            lines.append('# TYPE {} histogram'.format(name))
+            for label, value, histogram in series:
+                counts, total, count = histogram.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + ('+Inf',),
+                                               counts):
+                    cumulative += bucket_count
+                    lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(
+                        name, label, value, bound, cumulative))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(name, label, value,
+                                                           total))
+                lines.append('{}_count{{{}="{}"}} {}'.format(name, label,
+                                                             value, count))
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for name, value in sorted((values or {}).items()):
+                lines.append('# TYPE {} {}'.format(name, kind))
+                lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
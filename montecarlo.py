@@ -0,0 +1,175 @@
+import numpy as np
+
+from projection import (calc_metrics_batch, first_crossing, lag_adjust,
+                        resource_series, true_cases_series)
+from seir import project_seir, saturated
+
+
+SAMPLED_INPUTS = ('fatality_rate', 'days_death', 'doubling_time',
+                  'pct_hospitalization', 'pct_icu', 'pct_ventilator')
+
+# Same bounds as the dcc.Input boxes; samples are clipped to them.
+INPUT_BOUNDS = {
+    'fatality_rate': (0.1, 100),
+    'days_death': (1, 100),
+    'doubling_time': (1, 50),
+    'pct_hospitalization': (1, 50),
+    'pct_icu': (0.5, 20),
+    'pct_ventilator': (0.1, 10),
+}
+
+RESOURCES = (
+    ('hospitalizations', 'pct_hospitalization', 'num_beds'),
+    ('icus', 'pct_icu', 'num_icus'),
+    ('ventilators', 'pct_ventilator', 'num_ventilators'),
+)
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Same limit as the uncertainty input box.
+MAX_SPREAD_PCT = 90
+
+
+def sample(distribution, num_samples, rng):
+    # A distribution is a plain number (held fixed) or a tuple:
+    # ('uniform', low, high), ('triangular', low, mode, high) or
+    # ('normal', mean, sd).
+    if np.isscalar(distribution):
+        return np.full(num_samples, float(distribution))
+    kind, params = distribution[0], distribution[1:]
+    if kind == 'uniform':
+        return rng.uniform(params[0], params[1], num_samples)
+    if kind == 'triangular':
+        if params[0] == params[2]:
+            return np.full(num_samples, float(params[1]))
+        return rng.triangular(params[0], params[1], params[2], num_samples)
+    if kind == 'normal':
+        return rng.normal(params[0], params[1], num_samples)
+    raise ValueError('Unknown distribution: {}'.format(kind))
+
+
+def sample_inputs(distributions, num_samples, seed=None):
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for name in SAMPLED_INPUTS:
+        low, high = INPUT_BOUNDS[name]
+        samples[name] = np.clip(sample(distributions[name], num_samples, rng),
+                                low, high)
+    return samples
+
+
+def parse_spreads(spec):
+    # Per-input percent spreads given as 'name:pct' pairs with SAMPLED_INPUTS
+    # names, such as 'doubling_time:40,pct_icu:0'. An empty spec gives {}.
+    spreads = {}
+    for part in (spec or '').split(','):
+        if not part.strip():
+            continue
+        name, _, pct = part.partition(':')
+        try:
+            pct = float(pct)
+        except ValueError:
+            pct = -1
+        if name.strip() not in SAMPLED_INPUTS or not 0 <= pct <= MAX_SPREAD_PCT:
+            raise ValueError('Invalid input spread: {}'.format(part.strip()))
+        spreads[name.strip()] = pct
+    return spreads
+
+
+def format_spreads(spec):
+    # A spread spec in a canonical order, so equal specs share cache entries.
+    return ','.join('{}:{:g}'.format(name, pct)
+                    for name, pct in sorted(parse_spreads(spec).items()))
+
+
+def input_spreads(spread_pct, spec=None):
+    # Percent spread per SAMPLED_INPUTS name: spread_pct for every input,
+    # overridden by the pairs in spec.
+    spreads = dict.fromkeys(SAMPLED_INPUTS, spread_pct or 0)
+    spreads.update(parse_spreads(spec))
+    return spreads
+
+
+def relative_spread(point_values, spreads):
+    # Triangular distributions peaking at the point inputs and reaching
+    # +/- the input's percent either side; spreads is a percent for every
+    # input or a mapping from input_spreads().
+    if np.isscalar(spreads):
+        spreads = dict.fromkeys(point_values, spreads)
+    distributions = {}
+    for name, value in point_values.items():
+        spread = spreads[name] / 100
+        distributions[name] = ('triangular', value * (1-spread), value,
+                               value * (1+spread))
+    return distributions
+
+
+def simulate_samples(total_deaths, samples, capacities, sim_days,
+                     seir_options=None, kernels=None):
+    # With seir_options (keyword arguments for seir.project_seir) the samples
+    # run through the compartmental model instead of the doubling model.
+    # kernels maps series names to the doubling model's stay kernels. Also
+    # returns which samples saturated the compartmental model's population.
+    kernels = kernels or {}
+    _, number_times_cases_doubled, true_cases_today = calc_metrics_batch(
+        total_deaths, samples['fatality_rate'], samples['days_death'],
+        samples['doubling_time'])
+    if seir_options is not None:
+        # Same growth rate as the doubling model, see main.simulate.
+        series = project_seir(true_cases_today, number_times_cases_doubled,
+                              sim_days, samples['pct_hospitalization'],
+                              samples['pct_icu'], samples['pct_ventilator'],
+                              kernels=kernels, **seir_options)
+        full = saturated(true_cases_today, seir_options['population'])
+    else:
+        full = np.zeros(len(true_cases_today), dtype=bool)
+        true_cases = true_cases_series(true_cases_today,
+                                       number_times_cases_doubled, sim_days)
+        series = {'total': true_cases}
+        for name, pct, _ in RESOURCES:
+            series[name] = lag_adjust(resource_series(samples[pct]/100,
+                                                      true_cases),
+                                      kernel=kernels.get(name))
+    crossed = {name: first_crossing(series[name], capacities[capacity])
+               for name, _, capacity in RESOURCES}
+    return series, crossed, full
+
+
+def run_monte_carlo(total_deaths, distributions, capacities, sim_days,
+                    num_samples=2000, seed=None, percentiles=PERCENTILES,
+                    seir_options=None, kernels=None):
+    # distributions maps every SAMPLED_INPUTS name to a distribution,
+    # capacities maps num_beds/num_icus/num_ventilators to numbers. All
+    # samples run as one batch in the calling process; a heavy run is moved
+    # off the request thread as a whole by the server's executor.
+    samples = sample_inputs(distributions, num_samples, seed)
+    series, crossed, full = simulate_samples(total_deaths, samples,
+                                             capacities, sim_days,
+                                             seir_options, kernels)
+
+    with np.errstate(invalid='ignore'):
+        bands = {name: dict(zip(percentiles,
+                                np.percentile(values, percentiles, axis=0)))
+                 for name, values in series.items()}
+    shortage = {}
+    for name, first_day in crossed.items():
+        crossed_any = first_day >= 0
+        # Probability that the shortage starts on each lagged day.
+        distribution = np.bincount(first_day[crossed_any],
+                                   minlength=sim_days+1) / num_samples
+        shortage[name] = {
+            'probability': crossed_any.mean(),
+            'distribution': distribution,
+            'first_day': first_day,
+        }
+    return {'samples': samples, 'bands': bands, 'shortage': shortage,
+            'saturated': full.mean()}
+
+
+def shortage_day_percentile(first_day, q):
+    # Samples that never run short count as later than every day, so the
+    # result is -1 when fewer than q percent of samples cross.
+    never = np.iinfo(np.int64).max
+    days = np.sort(np.where(first_day >= 0, first_day, never))
+    day = days[int(np.floor(q / 100 * (len(days)-1)))]
+    return -1 if day == never else int(day)
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import stat
+import tempfile
+
+
+def is_private(path):
+    # True for a file or directory, not a symlink, that belongs to this user
+    # and that no other user can write to.
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    return (not stat.S_ISLNK(info.st_mode) and info.st_uid == os.getuid() and
+            not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+
+def check_private(path):
+    # Raises unless a file that is read back, and so trusted, is private.
+    if os.path.lexists(path) and not is_private(path):
+        raise PermissionError('Refusing {}: it must belong to this user and '
+                              'not be writable by others'.format(path))
+
+
+_private_dir = None
+
+
+def private_dir():
+    # The directory for files that the workers of this user share and read
+    # back: <temp dir>/covid-sim-<uid>, mode 0700. The shared temp directory
+    # lets anyone create that name first, so it is only used when it is
+    # private; otherwise a new random directory is used for this process.
+    global _private_dir
+    if _private_dir is None:
+        path = os.path.join(tempfile.gettempdir(),
+                            'covid-sim-{}'.format(os.getuid()))
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+        if not (is_private(path) and
+                not os.lstat(path).st_mode & (stat.S_IRWXG | stat.S_IRWXO)):
+            path = tempfile.mkdtemp(prefix='covid-sim-')
+        _private_dir = path
+    return _private_dir
+
+
+def write_atomic(path, write, binary=False, mode=0o644):
+    # Calls write(f) on a temporary file next to path, then renames it over
+    # path. Workers starting together may race; os.replace is atomic, so
+    # readers see the old file or the whole new one, never a partial write.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with (os.fdopen(fd, 'wb') if binary else
+              os.fdopen(fd, 'w', encoding='utf-8')) as f:
+            write(f)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def source_digest(*paths):
+    # Short digest of files, for names of caches derived from their code.
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
@@ -0,0 +1,285 @@
+import numpy as np
+
+from growth_table import growth_factors
+
+
+LAG_DAYS = 10
+
+
+def round_like_python(values, ndigits):
+    # np.round scales by 10**ndigits before rounding, which can disagree with
+    # Python's correctly rounded round() on values that sit on a tie, so
+    # those few elements are recomputed with round() itself.
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, ndigits)
+    scaled = values * 10**ndigits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded = np.array(rounded)
+        rounded[near_tie] = [round(float(v), ndigits) for v in values[near_tie]]
+    return rounded
+
+
+def calc_metrics_batch(total_deaths, fatality_rate, days_death, doubling_time):
+    # Array version of main.calc_metrics, one element per scenario.
+    total_deaths = np.asarray(total_deaths, dtype=np.float64)
+    fatality_rate = np.asarray(fatality_rate, dtype=np.float64)
+    days_death = np.asarray(days_death, dtype=np.float64)
+    doubling_time = np.asarray(doubling_time, dtype=np.float64)
+    number_cases_causing_death = np.round(total_deaths / (fatality_rate/100))
+    number_times_cases_doubled = round_like_python(days_death / doubling_time, 2)
+    true_cases_today = np.round(number_cases_causing_death *
+                                np.float_power(2, number_times_cases_doubled))
+    return (number_cases_causing_death, number_times_cases_doubled,
+            true_cases_today)
+
+
+def true_cases_series(true_cases_today, number_times_cases_doubled, sim_days):
+    # Scalars give one series of sim_days+1 values, arrays give one row per
+    # scenario. np.float_power goes through libm pow exactly like the scalar
+    # 2**x did in the old per-day loop, so the rounded counts are identical.
+    # When growth_table is loaded the powers of two come from it instead.
+    true_cases_today = np.asarray(true_cases_today, dtype=np.float64)[..., np.newaxis]
+    growth = growth_factors(number_times_cases_doubled, sim_days)
+    if growth is None:
+        number_times_cases_doubled = \
+            np.asarray(number_times_cases_doubled, dtype=np.float64)[..., np.newaxis]
+        day_nums = np.arange(sim_days+1)
+        with np.errstate(over='ignore'):
+            growth = np.float_power(2, day_nums / number_times_cases_doubled)
+    # Very long horizons overflow to inf, same as the scalar maths would.
+    with np.errstate(over='ignore', invalid='ignore'):
+        return np.round(true_cases_today * growth)
+
+
+def resource_series(case_factor, true_cases):
+    case_factor = np.asarray(case_factor, dtype=np.float64)
+    if case_factor.ndim:
+        case_factor = case_factor[..., np.newaxis]
+    return np.round(case_factor * true_cases)
+
+
+def as_counts(values):
+    # Whole-number series for display are kept as int64 while they fit, so
+    # the lag differences stay exact beyond 2**53 as they were with the old
+    # lists of ints. Larger counts stay float64: they are past what the
+    # browser can show exactly and JSON encoders reject ints over 64 bits.
+    values = np.asarray(values, dtype=np.float64)
+    if np.isfinite(values).all() and np.abs(values).max(initial=0) < 2**62:
+        return values.astype(np.int64)
+    return values
+
+
+def stay_kernel(spec):
+    # Parses a length-of-stay kernel: '10' for everyone leaving after 10 days,
+    # or 'day:weight' pairs such as '7:1,10:2,14:1'. Returns weights indexed
+    # by day, scaled to sum to 1. Days start at 1.
+    taps = {}
+    for part in str(spec).split(','):
+        day, _, weight = part.partition(':')
+        taps[int(day)] = float(weight or 1)
+    if min(taps) < 1 or min(taps.values()) < 0 or not sum(taps.values()):
+        raise ValueError('Invalid stay kernel: {}'.format(spec))
+    kernel = np.zeros(max(taps)+1)
+    for day, weight in taps.items():
+        kernel[day] = weight
+    return kernel / kernel.sum()
+
+
+def kernel_taps(kernel):
+    # (day, weight) pairs of a stay kernel; None is the 10-day rule.
+    if kernel is None:
+        return [(LAG_DAYS, 1.0)]
+    return [(int(day), kernel[day]) for day in np.flatnonzero(kernel)]
+
+
+def lag_adjust(num_cases, lag=LAG_DAYS, kernel=None):
+    # Cases still occupying a resource = cumulative cases minus the new cases
+    # from `lag` days earlier, which are assumed to have left the hospital.
+    # A stay kernel spreads that subtraction over several days: the new cases
+    # from each earlier day are weighted by the kernel and summed, one
+    # shifted multiply-add per kernel day, so the cost is linear in the
+    # horizon. A single-day kernel takes the exact integer path.
+    taps = kernel_taps(kernel) if kernel is not None else [(lag, 1.0)]
+    num_days = num_cases.shape[-1]
+    adjusted = np.array(num_cases)
+    if len(taps) == 1:
+        lag = taps[0][0]
+        if num_days > lag:
+            with np.errstate(invalid='ignore'):
+                num_new_cases = np.diff(adjusted, axis=-1)
+                adjusted[..., lag:] -= num_new_cases[..., :num_days-lag]
+        return adjusted
+    with np.errstate(invalid='ignore', over='ignore'):
+        num_new_cases = np.diff(adjusted.astype(np.float64), axis=-1)
+        removed = np.zeros(adjusted.shape)
+        for day, weight in taps:
+            if day < num_days:
+                removed[..., day:] += weight * num_new_cases[..., :num_days-day]
+        adjusted -= np.round(removed).astype(adjusted.dtype)
+    return adjusted
+
+
+def first_crossing(num_cases, num_capacity):
+    # Index of the first day above capacity along the last axis, -1 if never.
+    num_capacity = np.asarray(num_capacity, dtype=np.float64)
+    if num_capacity.ndim:
+        num_capacity = num_capacity[..., np.newaxis]
+    over_capacity = num_cases > num_capacity
+    crossed_idx = np.argmax(over_capacity, axis=-1)
+    return np.where(over_capacity.any(axis=-1), crossed_idx, -1)
+
+
+def date_axes(date_today, sim_days, lag=LAG_DAYS):
+    dates = np.datetime64(date_today, 'D') + np.arange(sim_days+1)
+    return dates, dates + lag
+
+
+def project(true_cases_today, number_times_cases_doubled, sim_days,
+            pct_hospitalization, pct_icu, pct_ventilator, kernels=None):
+    # kernels optionally maps resource series names to stay kernels.
+    kernels = kernels or {}
+    true_cases = true_cases_series(true_cases_today, number_times_cases_doubled,
+                                   sim_days)
+    pct_hospitalization = np.asarray(pct_hospitalization, dtype=np.float64)
+    pct_icu = np.asarray(pct_icu, dtype=np.float64)
+    pct_ventilator = np.asarray(pct_ventilator, dtype=np.float64)
+    return {
+        'total': true_cases,
+        'hospitalizations': lag_adjust(as_counts(
+            resource_series(pct_hospitalization/100, true_cases)),
+            kernel=kernels.get('hospitalizations')),
+        'icus': lag_adjust(as_counts(resource_series(pct_icu/100, true_cases)),
+                           kernel=kernels.get('icus')),
+        'ventilators': lag_adjust(as_counts(
+            resource_series(pct_ventilator/100, true_cases)),
+            kernel=kernels.get('ventilators')),
+    }
+
+
+# Widest span of days per scenario that shortage_day evaluates exactly; wider
+# spans (slow growth against a small capacity) search the whole segment.
+SOLVER_MAX_WINDOW = 64
+# Scenario x day elements per block when searching whole segments.
+SOLVER_BLOCK_SIZE = 2**20
+
+
+def resource_counts(true_cases_today, number_times_cases_doubled, case_factor,
+                    days):
+    # Resource counts before the lag adjustment on the given days, one row of
+    # days per scenario, computed with the same operations as project().
+    with np.errstate(over='ignore', invalid='ignore'):
+        true_cases = np.round(true_cases_today[:, np.newaxis] *
+                              np.float_power(2, days /
+                                             number_times_cases_doubled[:, np.newaxis]))
+        return as_counts(np.round(case_factor[:, np.newaxis] * true_cases))
+
+
+def lagged_counts(true_cases_today, number_times_cases_doubled, case_factor,
+                  days, kernel=None):
+    # Lag-adjusted resource counts on the given days, one row of days per
+    # scenario, computed with the same operations as project().
+    def counts(day_nums):
+        return resource_counts(true_cases_today, number_times_cases_doubled,
+                               case_factor, day_nums)
+
+    num_cases = counts(days)
+    taps = kernel_taps(kernel)
+    if len(taps) == 1:
+        lag = taps[0][0]
+        lagged = days >= lag
+        if lagged.any():
+            with np.errstate(invalid='ignore'):
+                num_new_cases = counts(days - lag + 1) - counts(days - lag)
+                num_cases = np.where(lagged, num_cases - num_new_cases, num_cases)
+        return num_cases
+    removed = np.zeros(num_cases.shape)
+    with np.errstate(invalid='ignore', over='ignore'):
+        for day, weight in taps:
+            num_new_cases = (counts(days - day + 1).astype(np.float64) -
+                             counts(days - day))
+            removed += np.where(days >= day, weight * num_new_cases, 0)
+        return num_cases - np.round(removed).astype(num_cases.dtype)
+
+
+def shortage_day(true_cases_today, number_times_cases_doubled, case_factor,
+                 num_capacity, sim_days, kernel=None):
+    # First index on the lagged axis where the lag-adjusted count exceeds
+    # capacity, -1 if never within sim_days; the same answer as
+    # first_crossing() on project()'s series, with the same stay kernel,
+    # without building the series.
+    #
+    # Between the days a stay kernel subtracts from, the count is a rounded
+    # version of scale * 2**(day/n) for a fixed scale, which is increasing:
+    # with kernel days d1 < d2 < ..., the segments are the days before d1,
+    # d1 to d2-1 and so on, and each kernel day reached takes its share of
+    # the new cases off the scale. Days where that curve is more than
+    # `margin` below capacity cannot cross and days where it is more than
+    # `margin` above must, so the day follows from a logarithm and only the
+    # few days in between are evaluated exactly.
+    true_cases_today, number_times_cases_doubled, case_factor, num_capacity = \
+        [np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in
+         np.broadcast_arrays(true_cases_today, number_times_cases_doubled,
+                             case_factor, num_capacity)]
+    n = number_times_cases_doubled
+    crossed = np.full(len(true_cases_today), -1, dtype=np.int64)
+    segments = []
+    start, factor = 0, np.ones_like(n)
+    for day, weight in sorted(kernel_taps(kernel)):
+        segments.append((start, min(day-1, sim_days), factor))
+        start = day
+        factor = factor - weight * (np.float_power(2, -(day-1)/n) -
+                                    np.float_power(2, -day/n))
+    segments.append((start, sim_days, factor))
+    for start, stop, factor in segments:
+        rows = np.flatnonzero(crossed < 0)
+        if start > sim_days or not len(rows):
+            break
+        if start > stop:
+            continue
+        scale = case_factor[rows] * true_cases_today[rows] * factor[rows]
+        capacity = num_capacity[rows]
+        # The rounded counts and the rounded sum of what the kernel removes
+        # are together off by less than four.
+        margin = 4 + 1e-9 * np.abs(capacity)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            low = np.where(capacity - margin > 0,
+                           n[rows] * np.log2((capacity - margin) / scale),
+                           -np.inf)
+            high = np.where(capacity + margin > 0,
+                            n[rows] * np.log2((capacity + margin) / scale),
+                            -np.inf)
+        first = np.clip(np.ceil(low), start, stop+1).astype(np.int64)
+        last = np.clip(np.floor(high), start-1, stop).astype(np.int64)
+        # Past `last` the count is certainly above capacity.
+        result = np.where(last < stop, last+1, -1)
+
+        width = last - first + 1
+        narrow = width <= SOLVER_MAX_WINDOW
+        num_days = max(width[narrow].max(initial=0), 0)
+        if num_days:
+            idx = np.flatnonzero(narrow & (width > 0))
+            days = first[idx, np.newaxis] + np.arange(num_days)
+            in_window = days <= last[idx, np.newaxis]
+            over = in_window & (lagged_counts(
+                true_cases_today[rows[idx]], n[rows[idx]],
+                case_factor[rows[idx]], np.minimum(days, stop), kernel) >
+                capacity[idx, np.newaxis])
+            result[idx] = np.where(over.any(axis=-1),
+                                   first[idx] + np.argmax(over, axis=-1),
+                                   result[idx])
+
+        wide = np.flatnonzero(~narrow)
+        days = np.arange(start, stop+1)
+        block = max(SOLVER_BLOCK_SIZE // len(days), 1)
+        for block_start in range(0, len(wide), block):
+            idx = wide[block_start:block_start+block]
+            num_cases = lagged_counts(
+                true_cases_today[rows[idx]], n[rows[idx]],
+                case_factor[rows[idx]],
+                np.broadcast_to(days, (len(idx), len(days))), kernel)
+            day = first_crossing(num_cases, capacity[idx])
+            result[idx] = np.where(day >= 0, start + day, -1)
+        crossed[rows] = result
+    return crossed
+
@@ -0,0 +1,160 @@
+import argparse
+import os
+import sys
+from datetime import datetime as dt
+
+import pandas as pd
+
+from sweep import DEFAULT_INPUTS, DEFAULT_SIM_DAYS, run_sweep
+
+
+# Shorter column names accepted in region files.
+COLUMN_ALIASES = {
+    'deaths': 'total_deaths',
+    'beds': 'num_beds',
+    'icus': 'num_icus',
+    'ventilators': 'num_ventilators',
+}
+
+# Inputs every region file must have; rates may be left out.
+REQUIRED_INPUTS = ('total_deaths', 'num_beds', 'num_icus', 'num_ventilators')
+
+# Rows read and simulated at a time.
+READ_CHUNK_SIZE = 100000
+
+
+def is_parquet(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+
+
+def read_regions(path, chunk_size=READ_CHUNK_SIZE):
+    # Yields DataFrames of at most chunk_size regions. Parquet needs pyarrow.
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def region_inputs(regions):
+    # Reads the simulation inputs of a chunk of regions whose columns have
+    # been renamed with COLUMN_ALIASES. Returns the inputs, one column per
+    # DEFAULT_INPUTS name, and per row a description of what is wrong with it,
+    # empty for rows that can be simulated. Deaths and capacities must be
+    # given for every region; a missing rate, as a whole column or an empty
+    # cell, takes the dashboard default.
+    missing = [name for name in REQUIRED_INPUTS if name not in regions]
+    if missing:
+        aliases = {name: alias for alias, name in COLUMN_ALIASES.items()}
+        raise ValueError('Region file has no {} column'.format(', '.join(
+            '{} (or {})'.format(name, aliases[name]) for name in missing)))
+    inputs = pd.DataFrame(index=regions.index)
+    problems = pd.Series('', index=regions.index)
+    for name, default in DEFAULT_INPUTS.items():
+        if name not in regions:
+            inputs[name] = default
+            continue
+        values = pd.to_numeric(regions[name], errors='coerce')
+        blank = regions[name].isna() | \
+            regions[name].astype(str).str.strip().eq('')
+        invalid = values.isna() & ~blank
+        problems[invalid] += 'invalid {}; '.format(name)
+        if name in REQUIRED_INPUTS:
+            problems[blank] += 'no {}; '.format(name)
+        else:
+            values[blank] = float(default)
+        inputs[name] = values
+    return inputs, problems.str.rstrip('; ')
+
+
+def simulate_regions(regions, sim_days=DEFAULT_SIM_DAYS, date_today=None):
+    # Columns that are not simulation inputs (region names, codes) are passed
+    # through in front of the results. Rows that cannot be simulated, see
+    # region_inputs(), have no results and say why in the problem column.
+    regions = regions.rename(columns=COLUMN_ALIASES)
+    id_columns = [name for name in regions.columns if name not in DEFAULT_INPUTS]
+    inputs, problems = region_inputs(regions)
+    valid = (problems == '').to_numpy()
+    result = run_sweep(inputs[valid], sim_days=sim_days, date_today=date_today)
+    result.index = regions.index[valid]
+    result = result.reindex(regions.index)
+    result[list(DEFAULT_INPUTS)] = inputs
+    result['problem'] = problems
+    return pd.concat([regions[id_columns], result],
+                     axis=1).reset_index(drop=True)
+
+
+class ParquetOutput:
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self._writer = None
+
+    def write(self, frame):
+        table = self._pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class CsvOutput:
+
+    def __init__(self, path):
+        self._file = sys.stdout if path == '-' else open(path, 'w', newline='')
+        self._header = True
+
+    def write(self, frame):
+        frame.to_csv(self._file, index=False, header=self._header)
+        self._header = False
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+def run_regions(path, out, sim_days=DEFAULT_SIM_DAYS, date_today=None,
+                chunk_size=READ_CHUNK_SIZE):
+    # Streams path chunk by chunk into out, so memory use does not grow with
+    # the number of regions. Returns the number of regions written.
+    if date_today is None:
+        date_today = dt.now().date()
+    output = ParquetOutput(out) if is_parquet(out) else CsvOutput(out)
+    num_regions = 0
+    try:
+        for regions in read_regions(path, chunk_size):
+            output.write(simulate_regions(regions, sim_days, date_today))
+            num_regions += len(regions)
+    finally:
+        output.close()
+    return num_regions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compute hospital bed, ICU and ventilator shortage dates '
+                    'for every region in a CSV or Parquet file.')
+    parser.add_argument('regions',
+                        help='CSV or Parquet file with one region per row')
+    parser.add_argument('--sim-days', type=int, default=DEFAULT_SIM_DAYS)
+    parser.add_argument('--chunk-size', type=int, default=READ_CHUNK_SIZE)
+    parser.add_argument('--out', default='-',
+                        help='output CSV or Parquet path, - for CSV on stdout')
+    args = parser.parse_args()
+    try:
+        run_regions(args.regions, args.out, sim_days=args.sim_days,
+                    chunk_size=args.chunk_size)
+    except ValueError as e:
+        parser.exit(2, 'regions.py: error: {}\n'.format(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+import argparse
+import importlib.util
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime as dt
+from html import escape
+
+import plotly.utils
+
+import main as dashboard
+from cache import normalize_inputs
+from montecarlo import format_spreads
+from regions import (COLUMN_ALIASES, READ_CHUNK_SIZE, read_regions,
+                     region_inputs)
+from sweep import DEFAULT_INPUTS, DEFAULT_SIM_DAYS
+
+
+# Regions rendered per task sent to a worker process.
+RENDER_CHUNK_SIZE = 64
+
+# Shared by every report in a directory; written once per run.
+PLOTLYJS_FILE = 'plotly.min.js'
+
+CHART_IDS = ('totals-estimate', 'hospitalizations-estimate', 'icus-estimate',
+             'ventilators-estimate')
+SHORTAGE_LABELS = ('Hospital bed shortage likely on:',
+                   'ICU shortage likely on:', 'Ventilator shortage likely on:')
+
+# Argument order of main.simulate after date_today.
+SIMULATION_INPUTS = ('total_deaths', 'fatality_rate', 'days_death',
+                     'doubling_time', 'num_beds', 'num_icus', 'num_ventilators',
+                     'sim_days', 'pct_hospitalization', 'pct_icu',
+                     'pct_ventilator')
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="{plotlyjs}"></script>
+<style>
+body {{font-family: Arial, sans-serif; margin: 2em 5%;}}
+table {{border-collapse: collapse; margin-bottom: 2em;}}
+th, td {{border-bottom: 1px solid #ddd; padding: 6px 12px; text-align: left;
+         font-size: 12px;}}
+td.value {{font-size: 16px;}}
+.shortages, .charts {{display: flex; flex-wrap: wrap;}}
+.shortage {{flex: 1; min-width: 200px;}}
+.shortage .label {{font-weight: bold; font-size: 14px;}}
+.shortage .date {{color: red; font-size: 24px;}}
+.shortage .detail {{color: #555; font-size: 12px;}}
+.chart {{width: 50%; min-width: 400px; height: 450px;}}
+</style>
+</head>
+<body>
+<h2>{title}</h2>
+<p>Simulated on {date} for {sim_days} days.</p>
+<table>
+<tr><th>Calculated metric names</th><th>Calculated metric values</th></tr>
+{rows}
+</table>
+<div class="shortages">
+{shortages}
+</div>
+<div class="charts">
+{charts}
+</div>
+<script>
+var figures = {figures};
+for (var id in figures) {{
+    Plotly.newPlot(id, figures[id].data, figures[id].layout,
+                   {{displayModeBar: false}});
+}}
+</script>
+</body>
+</html>
+'''
+
+
+def region_name(row, index):
+    # The region column if there is one, else the first column that is not a
+    # simulation input, else the row number.
+    names = [name for name in row
+             if name not in DEFAULT_INPUTS and name not in SIMULATION_INPUTS]
+    if 'region' in row:
+        names = ['region']
+    for name in names:
+        value = row[name]
+        if value == value and str(value).strip():
+            return str(value).strip()
+    return 'region-{}'.format(index)
+
+
+def file_stem(name, taken):
+    # A file name safe on every platform and unique within the run.
+    stem = re.sub(r'[^A-Za-z0-9._-]+', '-', name).strip('-.') or 'region'
+    candidate, n = stem, 1
+    while candidate.lower() in taken:
+        n += 1
+        candidate = '{}-{}'.format(stem, n)
+    taken.add(candidate.lower())
+    return candidate
+
+
+def simulation_inputs(values, sim_days):
+    # Whole numbers become ints in normalize_inputs so the charts show 50000,
+    # not 50000.0, as in the browser.
+    return normalize_inputs(int(sim_days) if name == 'sim_days'
+                            else float(values[name])
+                            for name in SIMULATION_INPUTS)
+
+
+def region_report(date_today, inputs, uncertainty_pct=0, model='doubling',
+                  spreads=''):
+    # The metrics table rows and the dashboard's four figures, shortage dates
+    # and shortage spreads, computed without the result cache so a batch does
+    # not crowd out the interactive users' entries.
+    (total_deaths, fatality_rate, days_death, doubling_time, num_beds, num_icus,
+     num_ventilators, _, pct_hospitalization, pct_icu, pct_ventilator) = inputs
+    rows = dashboard.calc_table_rows(*dashboard.calc_metrics(
+        total_deaths, fatality_rate, days_death, doubling_time))
+    result = dashboard.simulate(date_today, *inputs, uncertainty_pct, model,
+                                spreads, use_cache=False)
+    figures, dates_crossed, details = dashboard.bar_chart_figures(
+        result, num_beds, num_icus, num_ventilators, pct_hospitalization,
+        pct_icu, pct_ventilator, uncertainty_pct, model, spreads)
+    return rows, figures, dates_crossed, details
+
+
+def render_html(title, date_today, sim_days, rows, figures, dates_crossed,
+                details, plotlyjs):
+    rows_html = '\n'.join(
+        '<tr><td>{}</td><td class="value">{}</td></tr>'.format(
+            escape(str(row['Calculated metric names'])),
+            escape(str(row['Calculated metric values']))) for row in rows)
+    shortages = '\n'.join(
+        '<div class="shortage"><div class="label">{}</div>'
+        '<div class="date">{}</div>{}</div>'.format(
+            label, escape(str(date)),
+            '<div class="detail">{}</div>'.format(escape(detail))
+            if detail else '')
+        for label, date, detail in zip(SHORTAGE_LABELS, dates_crossed,
+                                       details or [None]*3))
+    charts = '\n'.join('<div class="chart" id="{}"></div>'.format(chart_id)
+                       for chart_id in CHART_IDS)
+    # </ is escaped so a label can never close the script element.
+    figures = json.dumps(dict(zip(CHART_IDS, figures)),
+                         cls=plotly.utils.PlotlyJSONEncoder).replace('</', '<\\/')
+    return PAGE.format(title=escape(title), plotlyjs=escape(plotlyjs),
+                       date=date_today.isoformat(), sim_days=sim_days,
+                       rows=rows_html, shortages=shortages, charts=charts,
+                       figures=figures)
+
+
+def table_figure(rows):
+    # The metrics table as a figure, for the static image formats.
+    return {
+        'data': [{'type': 'table',
+                  'header': {'values': ['<b>Calculated metric names</b>',
+                                        '<b>Calculated metric values</b>'],
+                             'align': 'left', 'fill': {'color': 'white'}},
+                  'cells': {'values': [[row['Calculated metric names'] for row in rows],
+                                       [row['Calculated metric values'] for row in rows]],
+                            'align': 'left', 'fill': {'color': 'white'}}}],
+        'layout': {'width': 700, 'height': 320,
+                   'margin': {'l': 20, 'r': 20, 't': 20, 'b': 20}},
+    }
+
+
+def render_chunk(regions, out_dir, date_today, sim_days, uncertainty_pct,
+                 model, spreads, plotlyjs, image_formats):
+    # Runs in a worker process: writes one HTML file per (stem, title, row)
+    # and, per image format, the table and the four charts. Returns the stems
+    # and titles written and the (title, problem) of regions that could not
+    # be simulated.
+    if image_formats:
+        import plotly.io as pio
+    written = []
+    skipped = []
+    for stem, title, inputs in regions:
+        try:
+            rows, figures, dates_crossed, details = region_report(
+                date_today, inputs, uncertainty_pct, model, spreads)
+        except (ArithmeticError, ValueError) as e:
+            skipped.append((title, str(e) or type(e).__name__))
+            continue
+        page = render_html(title, date_today, sim_days, rows, figures,
+                           dates_crossed, details, plotlyjs)
+        with open(os.path.join(out_dir, stem + '.html'), 'w',
+                  encoding='utf-8') as f:
+            f.write(page)
+        for fmt in image_formats:
+            images = [('table', table_figure(rows))] + list(zip(CHART_IDS, figures))
+            for name, figure in images:
+                pio.write_image(json.loads(json.dumps(
+                                    figure, cls=plotly.utils.PlotlyJSONEncoder)),
+                                os.path.join(out_dir, '{}-{}.{}'.format(
+                                    stem, name, fmt)),
+                                format=fmt)
+        written.append((stem, title))
+    return written, skipped
+
+
+def write_plotlyjs(out_dir):
+    from plotly.offline import get_plotlyjs
+    with open(os.path.join(out_dir, PLOTLYJS_FILE), 'w', encoding='utf-8') as f:
+        f.write(get_plotlyjs())
+
+
+def write_index(out_dir, written, skipped, date_today):
+    links = '\n'.join('<li><a href="{}.html">{}</a></li>'.format(
+        escape(stem), escape(title)) for stem, title in written)
+    problems = ''
+    if skipped:
+        problems = '<h3>Not rendered</h3>\n<ul>\n{}\n</ul>\n'.format('\n'.join(
+            '<li>{}: {}</li>'.format(escape(title), escape(problem))
+            for title, problem in skipped))
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8">'
+                '<title>Reports {0}</title></head>\n<body>\n'
+                '<h2>Reports {0}</h2>\n<ul>\n{1}\n</ul>\n{2}</body>\n</html>\n'.format(
+                    date_today.isoformat(), links, problems))
+
+
+def render_reports(path, out_dir, sim_days=DEFAULT_SIM_DAYS, date_today=None,
+                   uncertainty_pct=0, model='doubling', spreads='',
+                   processes=None, image_formats=(), plotlyjs=None,
+                   chunk_size=RENDER_CHUNK_SIZE):
+    # Renders a report for every region in a CSV or Parquet file into
+    # out_dir, spread over processes worker processes (all cores by
+    # default), with an index page. The reports load plotly.js from
+    # plotlyjs, by default one copy written next to them. Regions without
+    # deaths or capacities, or with values that are not numbers, are not
+    # rendered (see regions.region_inputs). Returns the number of reports
+    # and the (title, problem) of every region that was not rendered.
+    if date_today is None:
+        date_today = dt.now().date()
+    spreads = format_spreads(spreads)
+    os.makedirs(out_dir, exist_ok=True)
+    if plotlyjs is None:
+        write_plotlyjs(out_dir)
+        plotlyjs = PLOTLYJS_FILE
+    task_args = (out_dir, date_today, sim_days, uncertainty_pct, model,
+                 spreads, plotlyjs, tuple(image_formats))
+    taken = set()
+    written = []
+    skipped = []
+    with ProcessPoolExecutor(processes) as pool:
+        futures = []
+        index = 0
+        for frame in read_regions(path, READ_CHUNK_SIZE):
+            frame = frame.rename(columns=COLUMN_ALIASES)
+            inputs, problems = region_inputs(frame)
+            regions = []
+            for row, values, problem in zip(frame.to_dict('records'),
+                                            inputs.to_dict('records'),
+                                            problems):
+                title = region_name(row, index)
+                index += 1
+                if problem:
+                    skipped.append((title, problem))
+                    continue
+                regions.append((file_stem(title, taken), title,
+                                simulation_inputs(values, sim_days)))
+            futures += [pool.submit(render_chunk, regions[i:i+chunk_size],
+                                    *task_args)
+                        for i in range(0, len(regions), chunk_size)]
+        for future in futures:
+            chunk_written, chunk_skipped = future.result()
+            written += chunk_written
+            skipped += chunk_skipped
+    write_index(out_dir, written, skipped, date_today)
+    return len(written), skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Render the dashboard\'s metrics table and charts for '
+                    'every region in a CSV or Parquet file as static HTML '
+                    'reports, without running the server.')
+    parser.add_argument('regions',
+                        help='CSV or Parquet file with one region per row')
+    parser.add_argument('--out', default='reports', help='output directory')
+    parser.add_argument('--sim-days', type=int, default=DEFAULT_SIM_DAYS)
+    parser.add_argument('--uncertainty-pct', type=float, default=0)
+    parser.add_argument('--input-spreads', default='',
+                        help='per-input spreads overriding --uncertainty-pct, '
+                             'such as doubling_time:40,pct_icu:50')
+    parser.add_argument('--model', choices=('doubling', 'seir'),
+                        default='doubling')
+    parser.add_argument('--processes', type=int,
+                        help='worker processes, all cores by default')
+    parser.add_argument('--images', nargs='+', default=[],
+                        choices=('png', 'svg', 'pdf', 'jpeg', 'webp'),
+                        help='also write the table and charts as images '
+                             '(needs the kaleido package)')
+    parser.add_argument('--plotlyjs',
+                        help='plotly.js URL or path the reports load instead '
+                             'of a copy written to the output directory')
+    args = parser.parse_args()
+    if args.images and importlib.util.find_spec('kaleido') is None:
+        parser.error('--images needs the kaleido package')
+    try:
+        count, skipped = render_reports(
+            args.regions, args.out, sim_days=args.sim_days,
+            uncertainty_pct=args.uncertainty_pct, model=args.model,
+            spreads=args.input_spreads,
+            processes=args.processes, image_formats=args.images,
+            plotlyjs=args.plotlyjs)
+    except ValueError as e:
+        parser.exit(2, 'report.py: error: {}\n'.format(e))
+    for title, problem in skipped:
+        print('{}: not rendered, {}'.format(title, problem), file=sys.stderr)
+    print('{} reports written to {}'.format(count, args.out))
+
+
+if __name__ == '__main__':
+    main()
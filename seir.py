@@ -0,0 +1,138 @@
+import numpy as np
+
+from projection import LAG_DAYS, as_counts, project
+
+
+# Defaults for what the doubling model has no input for. The incubation and
+# infectious periods are early COVID-19 estimates; the stays match the
+# doubling model's assumption that patients leave after LAG_DAYS days.
+POPULATION = 50000000
+INCUBATION_DAYS = 5.2
+INFECTIOUS_DAYS = 2.9
+STAY_DAYS = (LAG_DAYS, LAG_DAYS, LAG_DAYS)
+STEPS_PER_DAY = 2
+# Largest solver step times the fastest rate of change; RK4 stays stable and
+# accurate to about 1e-4 per step below 0.5.
+MAX_STEP_RATE = 0.5
+
+
+def saturated(true_cases_today, population=POPULATION):
+    # Scenarios whose true cases today already reach the population, which
+    # leaves the compartmental model nobody to infect.
+    return np.asarray(true_cases_today, dtype=np.float64) >= population
+
+
+def initial_state(true_cases_today, doubling_time, share, leave, population,
+                  sigma, gamma):
+    # Starts the epidemic in its exponential phase: true_cases_today people
+    # infected so far, split between exposed, infectious and removed the way
+    # an SEIR epidemic growing at the doubling time's rate would have them,
+    # and beds already holding the patients admitted at that rate. beta is
+    # chosen so the initial growth rate matches the doubling time.
+    growth = np.log(2) / doubling_time
+    cumulative = np.minimum(true_cases_today, population)
+    susceptible = population - cumulative
+    infectious = cumulative / ((growth+gamma)/sigma + 1 + gamma/growth)
+    exposed = (growth+gamma)/sigma * infectious
+    with np.errstate(divide='ignore'):
+        beta = np.where(susceptible > 0,
+                        (growth+sigma) * (growth+gamma) / sigma *
+                        population / susceptible, 0)
+    incidence = beta * susceptible * infectious / population
+    occupied = share * incidence / (growth + leave)
+    return np.concatenate([[susceptible, exposed, infectious], occupied]), beta
+
+
+def project_seir(true_cases_today, doubling_time, sim_days, pct_hospitalization,
+                 pct_icu, pct_ventilator, population=POPULATION,
+                 incubation_days=INCUBATION_DAYS, infectious_days=INFECTIOUS_DAYS,
+                 stay_days=STAY_DAYS, steps_per_day=STEPS_PER_DAY,
+                 kernels=None):
+    # Same inputs and output shapes as projection.project, from a
+    # susceptible-exposed-infectious-removed model. Infections move pct_* of
+    # the new cases into bed, ICU and ventilator compartments, which empty
+    # after the stay_days on average. Occupancy on day k is shown on the
+    # lagged axis like the doubling model's bars, i.e. patients are admitted
+    # LAG_DAYS after infection. Scenarios are integrated together with
+    # classical Runge-Kutta, at least steps_per_day steps per day.
+    # doubling_time is the days the cases take to double early on; to match
+    # the doubling model, pass its number_times_cases_doubled, which is the
+    # period its curve doubles over. kernels are the doubling model's stay
+    # kernels, used for scenarios that saturate the population.
+    values = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in
+                                   (true_cases_today, doubling_time,
+                                    pct_hospitalization, pct_icu,
+                                    pct_ventilator)])
+    scalar = values[0].ndim == 0
+    true_cases_today, doubling_time, pct_hospitalization, pct_icu, \
+        pct_ventilator = [np.atleast_1d(v).ravel() for v in values]
+    sigma = 1 / incubation_days
+    gamma = 1 / infectious_days
+    share = np.stack([pct_hospitalization, pct_icu, pct_ventilator]) / 100
+    leave = 1 / np.asarray(stay_days, dtype=np.float64)[:, np.newaxis]
+    state, beta = initial_state(true_cases_today, doubling_time, share, leave,
+                                population, sigma, gamma)
+    # d(state)/dt = flow @ state + inflow * beta*S*I: the linear part moves
+    # people from exposed to infectious to removed and out of the beds, the
+    # new infections leave S for E and the resource compartments.
+    flow = np.zeros((6, 6))
+    flow[1, 1] = -sigma
+    flow[2, 1] = sigma
+    flow[2, 2] = -gamma
+    flow[3:, 3:] = np.diag(-leave[:, 0])
+    inflow = np.concatenate([np.stack([-np.ones_like(beta), np.ones_like(beta),
+                                       np.zeros_like(beta)]), share])
+    beta = beta / population
+
+    def derivative(state):
+        return flow @ state + inflow * (beta * state[0] * state[2])
+
+    def fastest_rate(state):
+        # Bound on how fast any compartment changes relative to its size:
+        # the growth of exposed and infectious, the drain of susceptibles
+        # and the outflows.
+        return np.max(np.sqrt(sigma * beta * state[0]) + beta * state[2] +
+                      sigma + gamma + leave.max())
+
+    days = np.empty((sim_days+1,) + state.shape)
+    days[0] = state
+    for day in range(1, sim_days+1):
+        remaining = 1.0
+        while remaining > 0:
+            # At least steps_per_day steps a day, more while the epidemic
+            # moves fast, so h times the fastest rate stays within
+            # MAX_STEP_RATE, inside RK4's stability region.
+            h = min(1 / steps_per_day, remaining,
+                    MAX_STEP_RATE / fastest_rate(state))
+            k1 = derivative(state)
+            k2 = derivative(state + h/2*k1)
+            k3 = derivative(state + h/2*k2)
+            k4 = derivative(state + h*k3)
+            state = state + h/6*(k1 + 2*(k2 + k3) + k4)
+            np.clip(state, 0, population, out=state)
+            remaining = remaining - h if remaining - h > 1e-9 else 0
+        days[day] = state
+
+    # (day, compartment, scenario) -> (compartment, scenario, day)
+    days = days.transpose(1, 2, 0)
+    series = {
+        'total': np.round(population - days[0]),
+        'hospitalizations': as_counts(np.round(days[3])),
+        'icus': as_counts(np.round(days[4])),
+        'ventilators': as_counts(np.round(days[5])),
+    }
+    full = saturated(true_cases_today, population)
+    if full.any():
+        # With nobody left to infect every bed would stay empty and no
+        # shortage would show, so these scenarios follow the doubling model
+        # (with the stay kernels) instead; see saturated().
+        doubling = project(true_cases_today[full], doubling_time[full],
+                           sim_days, pct_hospitalization[full], pct_icu[full],
+                           pct_ventilator[full], kernels=kernels)
+        for name in series:
+            values = np.array(series[name], dtype=np.float64)
+            values[full] = doubling[name]
+            series[name] = values if name == 'total' else as_counts(values)
+    if scalar:
+        series = {name: values[0] for name, values in series.items()}
+    return series
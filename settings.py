@@ -0,0 +1,120 @@
+import os
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+SIM_CACHE_MAX_ENTRIES = env_int('SIM_CACHE_MAX_ENTRIES', 1024)
+SIM_CACHE_TTL = env_float('SIM_CACHE_TTL', 3600)
+SIM_CACHE_MAX_BYTES = env_int('SIM_CACHE_MAX_BYTES', 32*1024*1024)
+# Results shared by all workers on the machine and kept across restarts, in
+# an SQLite file behind each worker's own cache. An empty path uses the
+# private temp directory (paths.private_dir); the file is refused if another
+# user can write to it. Off keeps every worker's results to itself.
+SHARED_CACHE = env_bool('SHARED_CACHE', False)
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH', '')
+SHARED_CACHE_MAX_BYTES = env_int('SHARED_CACHE_MAX_BYTES', 256*1024*1024)
+
+# With INCREMENTAL_UPDATES off, one callback fills both the table and the
+# charts; turning both off restores the original pair of callbacks that each
+# fire on submit-button.
+COMBINED_CALLBACK = env_bool('COMBINED_CALLBACK', True)
+# Update only the charts whose inputs changed since the last run, so a
+# capacity change sends one figure. Takes precedence over COMBINED_CALLBACK.
+INCREMENTAL_UPDATES = env_bool('INCREMENTAL_UPDATES', True)
+# Recompute as the inputs are edited, without the button (incremental mode
+# only). A request waits LIVE_DEBOUNCE seconds and is dropped if the same
+# session sends a newer one meanwhile; needs a threaded server.
+LIVE_UPDATES = env_bool('LIVE_UPDATES', False)
+LIVE_DEBOUNCE = env_float('LIVE_DEBOUNCE', 0.15)
+
+# Compute the four charts in the browser (assets/simulation.js) instead of on
+# the server. The Python engine stays the reference implementation.
+CLIENTSIDE_SIMULATION = env_bool('CLIENTSIDE_SIMULATION', False)
+
+# Powers of two for every doubling count and day, memory-mapped from a file
+# that is built on first start and shared by all workers on the machine.
+# An empty path uses a file in a directory of the system temp directory
+# that only this user can access (paths.private_dir).
+GROWTH_TABLE = env_bool('GROWTH_TABLE', True)
+GROWTH_TABLE_PATH = os.environ.get('GROWTH_TABLE_PATH', '')
+
+# Shorter cold starts: the chart layouts come from a JSON file written on the
+# first start (an empty path uses the private temp directory), the growth
+# table is opened on first use and the DataTable module on the first table.
+FAST_STARTUP = env_bool('FAST_STARTUP', True)
+CHART_LAYOUT_CACHE = os.environ.get('CHART_LAYOUT_CACHE', '')
+
+# Per-stage latency and payload size histograms served on /metrics.
+METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+
+# Smaller chart payloads: a start date and step instead of date lists, two
+# bar traces split at capacity instead of a colour per bar, and the capacity
+# line as a shape. The plotly template is cut down to what the charts use.
+COMPACT_FIGURES = env_bool('COMPACT_FIGURES', False)
+# Send numeric arrays as base64 typed arrays; needs plotly.js >= 2.28.
+COMPACT_TYPED_ARRAYS = env_bool('COMPACT_TYPED_ARRAYS', False)
+
+# Length-of-stay kernels of the doubling model, per resource: '10' subtracts
+# the new cases from 10 days earlier as the original model did, 'day:weight'
+# pairs such as '7:1,10:2,14:1' spread the subtraction over several days.
+BED_STAY_KERNEL = os.environ.get('BED_STAY_KERNEL', '10')
+ICU_STAY_KERNEL = os.environ.get('ICU_STAY_KERNEL', '10')
+VENTILATOR_STAY_KERNEL = os.environ.get('VENTILATOR_STAY_KERNEL', '10')
+
+# Engine selected when the page loads: 'doubling' (calc_metrics and the
+# 10-day lag subtraction) or 'seir' (compartmental model, see seir.py). The
+# SEIR_* values are the compartmental model's parameters that have no input
+# on the page; stays are average days in a bed, ICU or on a ventilator.
+SIMULATION_MODEL = os.environ.get('SIMULATION_MODEL', 'doubling')
+SEIR_POPULATION = env_float('SEIR_POPULATION', 50000000)
+SEIR_INCUBATION_DAYS = env_float('SEIR_INCUBATION_DAYS', 5.2)
+SEIR_INFECTIOUS_DAYS = env_float('SEIR_INFECTIOUS_DAYS', 2.9)
+SEIR_BED_STAY_DAYS = env_float('SEIR_BED_STAY_DAYS', 10)
+SEIR_ICU_STAY_DAYS = env_float('SEIR_ICU_STAY_DAYS', 10)
+SEIR_VENTILATOR_STAY_DAYS = env_float('SEIR_VENTILATOR_STAY_DAYS', 10)
+SEIR_STEPS_PER_DAY = env_int('SEIR_STEPS_PER_DAY', 2)
+
+# Monte Carlo mode, used when the uncertainty input is above zero. The seed is
+# fixed so a cached result matches a fresh one. Heavy runs go to the
+# EXECUTOR_PROCESSES pool like any other heavy chart request.
+MONTE_CARLO_SAMPLES = env_int('MONTE_CARLO_SAMPLES', 2000)
+MONTE_CARLO_SEED = env_int('MONTE_CARLO_SEED', 0)
+
+# Process pool for heavy bar chart requests; 0 runs everything inline. Requests
+# whose cost (days times Monte Carlo samples) is at most EXECUTOR_INLINE_MAX_COST
+# stay inline. Beyond processes + EXECUTOR_MAX_QUEUE pending tasks, or after
+# EXECUTOR_TIMEOUT seconds, the charts are replaced by a busy notice. The
+# timeout must stay below SERVER_TIMEOUT so the notice is sent before gunicorn
+# kills the worker; gunicorn.conf.py refuses to start otherwise.
+EXECUTOR_PROCESSES = env_int('EXECUTOR_PROCESSES', 0)
+EXECUTOR_MAX_QUEUE = env_int('EXECUTOR_MAX_QUEUE', 8)
+EXECUTOR_TIMEOUT = env_float('EXECUTOR_TIMEOUT', 20)
+EXECUTOR_INLINE_MAX_COST = env_int('EXECUTOR_INLINE_MAX_COST', 10000)
+
+# Limits for the /export/csv and /export/ndjson endpoints, which stream the
+# daily series of one scenario (query parameters) or a batch (POSTed JSON).
+EXPORT_MAX_DAYS = env_int('EXPORT_MAX_DAYS', 36500)
+EXPORT_MAX_SCENARIOS = env_int('EXPORT_MAX_SCENARIOS', 10000)
+
+# gunicorn worker settings, read by gunicorn.conf.py. sync serves one request
+# per worker at a time; gthread serves SERVER_THREADS at once per worker and
+# gevent (pip install gevent) up to SERVER_WORKER_CONNECTIONS, so slow
+# clients do not hold a whole worker.
+SERVER_WORKER_CLASS = os.environ.get('SERVER_WORKER_CLASS', 'sync')
+SERVER_WORKERS = env_int('SERVER_WORKERS', 1)
+SERVER_THREADS = env_int('SERVER_THREADS', 8)
+SERVER_WORKER_CONNECTIONS = env_int('SERVER_WORKER_CONNECTIONS', 1000)
+SERVER_TIMEOUT = env_int('SERVER_TIMEOUT', 30)
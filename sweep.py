@@ -0,0 +1,133 @@
+import argparse
+import sys
+from datetime import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+import settings
+from projection import LAG_DAYS, calc_metrics_batch, shortage_day, stay_kernel
+
+
+DEFAULT_INPUTS = {
+    'total_deaths': 2,
+    'fatality_rate': 5,
+    'days_death': 17.3,
+    'doubling_time': 6.18,
+    'num_beds': 50000,
+    'num_icus': 10000,
+    'num_ventilators': 1000,
+    'pct_hospitalization': 20,
+    'pct_icu': 5,
+    'pct_ventilator': 1,
+}
+DEFAULT_SIM_DAYS = 30
+
+RESOURCES = (
+    ('bed', 'pct_hospitalization', 'num_beds'),
+    ('icu', 'pct_icu', 'num_icus'),
+    ('ventilator', 'pct_ventilator', 'num_ventilators'),
+)
+# Names of the resource series in project(), in RESOURCES order.
+SERIES = ('hospitalizations', 'icus', 'ventilators')
+
+
+def stay_kernels():
+    # The stay kernels the dashboard is configured with, so batch shortage
+    # dates agree with its charts and exports.
+    return dict(zip(SERIES, [stay_kernel(settings.BED_STAY_KERNEL),
+                             stay_kernel(settings.ICU_STAY_KERNEL),
+                             stay_kernel(settings.VENTILATOR_STAY_KERNEL)]))
+
+
+def parameter_grid(**values):
+    names = list(values)
+    axes = np.meshgrid(*[np.atleast_1d(np.asarray(values[name], dtype=np.float64))
+                         for name in names], indexing='ij')
+    return pd.DataFrame({name: axis.ravel() for name, axis in zip(names, axes)})
+
+
+def scenario_frame(scenarios):
+    # Accepts a DataFrame, a dict of columns or a list of parameter dicts.
+    # Parameters that are not given take the dashboard defaults.
+    frame = pd.DataFrame(scenarios).reset_index(drop=True)
+    unknown = set(frame.columns) - set(DEFAULT_INPUTS)
+    if unknown:
+        raise ValueError('Unknown scenario parameters: {}'.format(
+            ', '.join(sorted(unknown))))
+    for name, value in DEFAULT_INPUTS.items():
+        if name not in frame:
+            frame[name] = value
+    return frame[list(DEFAULT_INPUTS)]
+
+
+def shortage_days(inputs, sim_days, kernels=None):
+    # inputs maps every DEFAULT_INPUTS name to an array with one element per
+    # scenario. Returns calc_metrics outputs and, per resource, the index of
+    # the first day above capacity on the lagged axis (-1 if never). kernels
+    # maps series names to stay kernels, as in project().
+    kernels = kernels or {}
+    number_cases_causing_death, number_times_cases_doubled, true_cases_today = \
+        calc_metrics_batch(inputs['total_deaths'], inputs['fatality_rate'],
+                           inputs['days_death'], inputs['doubling_time'])
+    crossed = {name: shortage_day(true_cases_today, number_times_cases_doubled,
+                                  inputs[pct]/100, inputs[capacity], sim_days,
+                                  kernels.get(series))
+               for (name, pct, capacity), series in zip(RESOURCES, SERIES)}
+    metrics = {
+        'number_cases_causing_death': number_cases_causing_death,
+        'number_times_cases_doubled': number_times_cases_doubled,
+        'true_cases_today': true_cases_today,
+    }
+    return metrics, crossed
+
+
+def run_sweep(scenarios, sim_days=DEFAULT_SIM_DAYS, date_today=None,
+              kernels=None):
+    # kernels defaults to the configured stay kernels, see stay_kernels().
+    if date_today is None:
+        date_today = dt.now().date()
+    if kernels is None:
+        kernels = stay_kernels()
+    frame = scenario_frame(scenarios)
+    inputs = {name: frame[name].to_numpy(dtype=np.float64)
+              for name in DEFAULT_INPUTS}
+    metrics, crossed = shortage_days(inputs, sim_days, kernels)
+
+    result = frame.copy()
+    for name, values in metrics.items():
+        result[name] = values
+    first_lag_date = np.datetime64(date_today, 'D') + LAG_DAYS
+    for name, _, _ in RESOURCES:
+        result['{}_shortage_date'.format(name)] = np.where(
+            crossed[name] >= 0, first_lag_date + crossed[name],
+            np.datetime64('NaT'))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the simulation over a grid of parameter values and '
+                    'write the shortage dates of every scenario as CSV.')
+    for name, value in DEFAULT_INPUTS.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=float,
+                            nargs='+', default=[value])
+    parser.add_argument('--scenarios',
+                        help='CSV file with one parameter set per row; '
+                             'used instead of the grid arguments')
+    parser.add_argument('--sim-days', type=int, default=DEFAULT_SIM_DAYS)
+    parser.add_argument('--out', default='-',
+                        help='output CSV path, - for stdout')
+    args = parser.parse_args()
+
+    if args.scenarios:
+        scenarios = pd.read_csv(args.scenarios)
+    else:
+        scenarios = parameter_grid(**{name: getattr(args, name)
+                                      for name in DEFAULT_INPUTS})
+    result = run_sweep(scenarios, sim_days=args.sim_days)
+    result.to_csv(sys.stdout if args.out == '-' else args.out, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from cache import SharedResultStore, SimulationCache, TieredCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_entries_expire():
+    clock = Clock()
+    cache = SimulationCache(ttl=10, clock=clock)
+    cache.set('a', 1)
+    clock.now += 9
+    assert cache.get('a') == 1
+    clock.now += 1
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = SimulationCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_cache_evicts_to_the_size_cap():
+    cache = SimulationCache(max_bytes=2500)
+    cache.set('a', np.zeros(100))
+    cache.set('b', np.zeros(100))
+    cache.set('c', np.zeros(200))
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] <= 2500
+    # A value over the cap is not stored at all.
+    cache.set('d', np.zeros(1000))
+    assert cache.get('d') is None and cache.get('c') is not None
+
+
+def test_cached_arrays_are_read_only():
+    cache = SimulationCache()
+    cache.set('a', {'series': np.arange(3)})
+    with pytest.raises(ValueError):
+        cache.get('a')['series'][0] = 1
+
+
+def test_store_round_trips_values(tmp_path):
+    store = SharedResultStore(str(tmp_path / 'results.sqlite'))
+    value = {'series': np.arange(5), 'saturated': np.float64(0.5),
+             'dates': ['2020-04-01'], 'key': (1, None)}
+    store.set('a', value)
+    found = store.get('a')
+    assert np.array_equal(found['series'], value['series'])
+    assert found['saturated'] == 0.5 and found['key'] == (1, None)
+
+
+def test_store_entries_expire(tmp_path):
+    clock = Clock()
+    store = SharedResultStore(str(tmp_path / 'results.sqlite'), ttl=10,
+                              clock=clock)
+    store.set('a', 1)
+    clock.now += 9
+    assert store.get('a') == 1
+    clock.now += 1
+    assert store.get('a') is None
+
+
+def test_store_evicts_expired_then_least_recently_used(tmp_path):
+    clock = Clock()
+    store = SharedResultStore(str(tmp_path / 'results.sqlite'), ttl=1000,
+                              max_bytes=3000, clock=clock)
+    store.set('old', np.zeros(100))
+    clock.now += 10
+    store.set('a', np.zeros(100))
+    clock.now += 10
+    store.set('b', np.zeros(100))
+    clock.now += store.TOUCH_INTERVAL + 1
+    assert store.get('old') is not None
+    clock.now += 30
+    store.set('c', np.zeros(100))
+    # 'a' was used least recently; 'old' was read since.
+    assert store.get('a') is None
+    assert store.get('old') is not None and store.get('c') is not None
+    assert store.stats()['bytes'] <= 3000
+    # Once the others expire they make room before any live entry goes.
+    clock.now += 1000
+    store.set('d', np.zeros(200))
+    assert store.get('d') is not None
+    assert store.stats()['entries'] == 1
+
+
+def test_store_clear_keeps_other_namespaces(tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    live = SharedResultStore(path, namespace='v1:')
+    benchmark = SharedResultStore(path, namespace='benchmark-1:v1:')
+    live.set('a', 1)
+    benchmark.set('a', 2)
+    benchmark.clear()
+    assert benchmark.get('a') is None
+    assert live.get('a') == 1
+
+
+def store_in_child(store):
+    store.set('child', np.arange(4))
+
+
+def test_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    store = SharedResultStore(path, namespace='v1:')
+    store.set('parent', 1)
+    # Forked after the parent opened its connection, the child's store must
+    # open its own, and another process must see what it wrote.
+    process = multiprocessing.get_context('fork').Process(
+        target=store_in_child, args=(store,))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+    assert np.array_equal(store.get('child'), np.arange(4))
+    assert store.get('parent') == 1
+    other = SharedResultStore(path, namespace='v1:')
+    assert np.array_equal(other.get('child'), np.arange(4))
+
+
+def test_tiered_cache_copies_shared_hits(tmp_path):
+    shared = SharedResultStore(str(tmp_path / 'results.sqlite'))
+    shared.set('a', 1)
+    cache = TieredCache(SimulationCache(), shared)
+    assert cache.get('a') == 1
+    assert cache.local.get('a') == 1
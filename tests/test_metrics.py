@@ -0,0 +1,27 @@
+import main
+from sweep import DEFAULT_INPUTS
+
+
+def test_incremental_updates_record_chart_payloads():
+    values = [DEFAULT_INPUTS[name] for name in main.SIMULATION_INPUTS[:7]]
+    values += [30] + [DEFAULT_INPUTS[name] for name in
+                      ('pct_hospitalization', 'pct_icu', 'pct_ventilator')]
+    outputs = main.update_incremental(1, *values, 0, 'doubling', '', None)
+    state = outputs[-1]
+    # A capacity change redraws one chart, which is recorded on its own.
+    before = main.stage_metrics.histogram(
+        'simulation_payload_bytes', 'output', 'icus-estimate',
+        ()).snapshot()[2]
+    values[5] += 1
+    main.update_incremental(2, *values, 0, 'doubling', '', state)
+    rendered = main.stage_metrics.render()
+    for output in ('totals-estimate', 'hospitalizations-estimate',
+                   'icus-estimate', 'ventilators-estimate'):
+        assert 'simulation_payload_bytes_count{{output="{}"}}'.format(
+            output) in rendered
+        assert 'simulation_stage_seconds_count{{stage="serialize_{}"}}'.format(
+            output) in rendered
+    after = main.stage_metrics.histogram(
+        'simulation_payload_bytes', 'output', 'icus-estimate',
+        ()).snapshot()[2]
+    assert after == before + 1
@@ -0,0 +1,36 @@
+from datetime import date
+
+import pytest
+
+import main
+from montecarlo import format_spreads, input_spreads, parse_spreads
+
+
+DATE = date(2020, 4, 1)
+INPUTS = (2, 5, 17.3, 6.18, 50000, 10000, 1000, 30, 20, 5, 1)
+
+
+def test_spread_specs():
+    assert format_spreads(' pct_icu:50, doubling_time:40.0') == \
+        'doubling_time:40,pct_icu:50'
+    spreads = input_spreads(10, 'pct_icu:0')
+    assert spreads['pct_icu'] == 0 and spreads['doubling_time'] == 10
+    for spec in ('beds:10', 'pct_icu', 'pct_icu:-1', 'pct_icu:95'):
+        with pytest.raises(ValueError):
+            parse_spreads(spec)
+
+
+def test_input_spread_samples_only_that_input():
+    result = main.simulate(DATE, *INPUTS, 0, 'doubling', 'pct_icu:50',
+                           use_cache=False)
+    widths = {name: (bands[95] - bands[5]).max()
+              for name, bands in result['bands'].items()}
+    assert widths['icus'] > 0
+    assert widths['total'] == widths['hospitalizations'] == 0
+    figures, _, details = main.bar_chart_figures(
+        result, *INPUTS[4:7], *INPUTS[8:], 0, 'doubling', 'pct_icu:50')
+    # The shortage date distribution is drawn on its own axis.
+    chance = figures[2]['data'][-1]
+    assert chance['yaxis'] == 'y2'
+    assert 'pct_icu ±50%' in figures[2]['layout']['title']['text']
+    assert len(details) == 3
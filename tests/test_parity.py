@@ -0,0 +1,33 @@
+import random
+import shutil
+from datetime import date
+
+import numpy as np
+import pytest
+
+import clientside_parity
+import engine_parity
+
+
+SEED = 0
+
+
+def test_engine_matches_the_per_day_loop():
+    rng = random.Random(SEED)
+    for _ in range(200):
+        scenario = engine_parity.random_scenario(rng)
+        assert engine_parity.check_baseline(scenario) == [], scenario
+
+
+@pytest.mark.parametrize('sim_days', (5, 90, 365))
+def test_engine_matches_the_full_series(sim_days):
+    rng = np.random.default_rng(SEED)
+    _, problems = engine_parity.check_batch(rng, 2000, sim_days)
+    assert not any(problems.values()), problems
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+def test_clientside_engine_matches_the_server():
+    rng = random.Random(SEED)
+    scenarios = [engine_parity.random_inputs(rng) for _ in range(50)]
+    assert clientside_parity.mismatches(date(2020, 4, 1), scenarios) == []
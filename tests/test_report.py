@@ -0,0 +1,61 @@
+from datetime import date
+
+import plotly.io
+
+import main
+import report
+from sweep import DEFAULT_INPUTS
+
+
+DATE = date(2020, 4, 1)
+
+
+def default_inputs(sim_days=30):
+    return report.simulation_inputs(DEFAULT_INPUTS, sim_days)
+
+
+def test_images_are_written_for_table_and_charts(tmp_path, monkeypatch):
+    written = []
+
+    def write_image(figure, path, format):
+        written.append((path, format, figure))
+
+    monkeypatch.setattr(plotly.io, 'write_image', write_image)
+    done, skipped = report.render_chunk(
+        [('region', 'Region', default_inputs())], str(tmp_path), DATE, 30, 0,
+        'doubling', '', 'plotly.min.js', ('png', 'svg'))
+    assert done == [('region', 'Region')]
+    assert skipped == []
+    assert (tmp_path / 'region.html').exists()
+    names = ['table'] + list(report.CHART_IDS)
+    assert [(path, fmt) for path, fmt, _ in written] == [
+        (str(tmp_path / 'region-{}.{}'.format(name, fmt)), fmt)
+        for fmt in ('png', 'svg') for name in names]
+    # Figures reach the image writer as plain JSON data.
+    for _, _, figure in written:
+        assert isinstance(figure, dict) and figure['data']
+
+
+def test_bad_regions_are_reported_not_rendered(tmp_path):
+    regions = tmp_path / 'regions.csv'
+    regions.write_text('name,deaths,beds,icus,ventilators,fatality_rate\n'
+                       'Good,10,5000,100,50,1\n'
+                       'NoDeaths,,5000,100,50,1\n'
+                       'BadBeds,10,many,100,50,1\n'
+                       'DefaultRate,10,5000,100,50,\n')
+    out = tmp_path / 'reports'
+    count, skipped = report.render_reports(str(regions), str(out),
+                                           date_today=DATE, processes=1,
+                                           plotlyjs='plotly.min.js')
+    assert count == 2
+    assert skipped == [('NoDeaths', 'no total_deaths'),
+                       ('BadBeds', 'invalid num_beds')]
+    assert sorted(p.name for p in out.iterdir()) == [
+        'DefaultRate.html', 'Good.html', 'index.html']
+    assert 'NoDeaths: no total_deaths' in (out / 'index.html').read_text()
+
+
+def test_reports_leave_the_result_cache_alone():
+    before = main.simulation_cache.stats()
+    report.region_report(DATE, default_inputs(45))
+    assert main.simulation_cache.stats() == before